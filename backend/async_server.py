@@ -0,0 +1,195 @@
+import io
+import asyncio
+import threading
+import urllib.parse
+import http.client
+import concurrent.futures
+
+from server import Handler, CORS_HEADERS, SSE_KEEP_ALIVE_INTERVAL, SSE_WRITE_TIMEOUT
+from sse import KEEP_ALIVE
+
+
+# Longest a client may take to send its request
+REQUEST_TIMEOUT = 10
+
+
+class BufferedHandler(Handler):
+    """
+    Runs one request that was already read off the socket through Handler's
+    routes, collecting the response in memory instead of writing to a socket.
+    """
+
+    def __init__(self, raw, client_address, **kwargs):
+        self.raw = raw
+        super().__init__(None, client_address, None, **kwargs)
+
+    def setup(self):
+        self.rfile = io.BytesIO(self.raw)
+        self.wfile = io.BytesIO()
+
+    def finish(self):
+        pass
+
+
+class AsyncServer:
+    """
+    Serves the same routes as the threaded server from a single event loop.
+
+    Requests are read and responses written by the loop, while the routes
+    themselves (and so every database read) run in a small executor sized
+    like the connection pool. Event streams never take a thread: they wait on
+    the loop, which the broadcaster wakes from the game loop's thread.
+
+    Exposes serve_forever and shutdown like socketserver's servers, so it can
+    be run from main the same way.
+    """
+
+    def __init__(self, address, broadcaster, pool, **handler_kwargs):
+        self.address = address
+        self.broadcaster = broadcaster
+        self.handler_kwargs = dict(handler_kwargs, broadcaster=broadcaster, pool=pool)
+        self.executor = concurrent.futures.ThreadPoolExecutor(
+            max_workers=pool.size, thread_name_prefix="http")
+        self.loop = None
+        # Set by shutdown, so that a shutdown before the loop started still stops it
+        self.stop_requested = threading.Event()
+        self.stopped = None
+        self.wakeup = None
+        self.streams = set()
+        self.broadcaster.watch(self.notify)
+
+    def serve_forever(self):
+        asyncio.run(self.serve())
+
+    def shutdown(self):
+        self.stop_requested.set()
+        loop = self.loop
+        if loop is not None:
+            try:
+                loop.call_soon_threadsafe(self.stopped.set)
+            except RuntimeError:
+                # The loop already closed
+                pass
+
+    def notify(self):
+        # Called from the broadcasting thread
+        loop = self.loop
+        if loop is None:
+            return
+        try:
+            loop.call_soon_threadsafe(self.wake)
+        except RuntimeError:
+            # The loop was closed while shutting down
+            pass
+
+    def wake(self):
+        wakeup = self.wakeup
+        self.wakeup = asyncio.Event()
+        wakeup.set()
+
+    async def serve(self):
+        self.stopped = asyncio.Event()
+        self.wakeup = asyncio.Event()
+        self.loop = asyncio.get_running_loop()
+        if self.stop_requested.is_set():
+            self.stopped.set()
+
+        (host, port) = self.address
+        server = await asyncio.start_server(self.handle, host or None, port)
+        await self.stopped.wait()
+
+        server.close()
+        tasks = list(self.streams)
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        await server.wait_closed()
+        self.loop = None
+        self.executor.shutdown(wait=True)
+
+    async def handle(self, reader, writer):
+        try:
+            head = await asyncio.wait_for(reader.readuntil(b"\r\n\r\n"), REQUEST_TIMEOUT)
+            (request_line, _, header_lines) = head.partition(b"\r\n")
+            headers = http.client.parse_headers(io.BytesIO(header_lines))
+            (method, path) = request_line.decode("latin-1").split()[:2]
+
+            # Routed on the path alone, like Handler.dispatch
+            if method == "GET" and urllib.parse.urlsplit(path).path == "/events":
+                await self.stream_events(writer, headers)
+                return
+
+            body = b""
+            content_length = int(headers.get("Content-Length") or 0)
+            if content_length > 0:
+                body = await asyncio.wait_for(reader.readexactly(content_length), REQUEST_TIMEOUT)
+
+            response = await self.loop.run_in_executor(
+                self.executor, self.respond, head + body, writer.get_extra_info("peername"))
+            writer.write(response)
+            await asyncio.wait_for(writer.drain(), SSE_WRITE_TIMEOUT)
+        except (ConnectionError, asyncio.TimeoutError, asyncio.IncompleteReadError,
+                asyncio.LimitOverrunError, ValueError):
+            pass
+        except Exception as e:
+            print(f"[server]: Error handling request: {e}")
+        finally:
+            writer.close()
+
+    def respond(self, raw, client_address):
+        handler = BufferedHandler(raw, client_address or ("", 0), **self.handler_kwargs)
+        return handler.wfile.getvalue()
+
+    async def stream_events(self, writer, headers):
+        last_event_id = headers.get("Last-Event-ID")
+        try:
+            last_event_id = int(last_event_id) if last_event_id else None
+        except ValueError:
+            last_event_id = None
+
+        writer.write(
+            b"HTTP/1.1 200 OK\r\n"
+            b"Content-type: text/event-stream\r\n"
+            b"Cache-Control: no-cache\r\n"
+            b"Connection: keep-alive\r\n"
+            + b"".join(f"{name}: {value}\r\n".encode() for (name, value) in CORS_HEADERS.items())
+            + b"\r\n"
+        )
+
+        task = asyncio.current_task()
+        self.streams.add(task)
+        listener, backlog = self.broadcaster.register(last_event_id)
+        try:
+            await self.send_events(writer, listener, backlog)
+            while True:
+                # Taken before reading, so an event broadcast after the read still wakes us
+                wakeup = self.wakeup
+                messages = self.broadcaster.read(listener, timeout=0)
+                if messages:
+                    await self.send_events(writer, listener, messages)
+                    continue
+
+                try:
+                    await asyncio.wait_for(wakeup.wait(), SSE_KEEP_ALIVE_INTERVAL)
+                except asyncio.TimeoutError:
+                    writer.write(KEEP_ALIVE)
+                    await asyncio.wait_for(writer.drain(), SSE_WRITE_TIMEOUT)
+                    listener.keep_alives += 1
+        except (ConnectionError, asyncio.TimeoutError) as e:
+            print(f"[server]: Client disconnected ({type(e).__name__})")
+        except asyncio.CancelledError:
+            # Shutting down; handle closes the connection
+            pass
+        finally:
+            self.streams.discard(task)
+            self.broadcaster.unregister(listener)
+
+    async def send_events(self, writer, listener, messages):
+        if not messages:
+            return
+
+        data = b"".join(messages)
+        started = self.loop.time()
+        writer.write(data)
+        await asyncio.wait_for(writer.drain(), SSE_WRITE_TIMEOUT)
+        listener.wrote(len(messages), len(data), self.loop.time() - started)
@@ -0,0 +1,196 @@
+"""
+Request latency of the endpoints that read run counts and clear times on
+large histories, with every migration applied. They read the counters in
+dungeons_entries_stats, so they should stay flat as the history grows. Also
+times starting and finishing a run, the write that pays for keeping the
+counters and dungeons_entries' indexes up to date.
+
+With --baseline, the history is first written with only the migrations from
+before the indexes migration, and the per-character, per-dungeon stats are
+timed the way get_dungeon_stats used to compute them (scanning
+dungeons_entries): once as is, once with just the indexes migration applied,
+and once from the counters after every migration.
+
+Usage (from the backend directory):
+    python benchmarks/dungeons_entries.py --rows 10000 100000 1000000 --baseline
+"""
+import os
+import sys
+import time
+import random
+import argparse
+import tempfile
+import datetime
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from yoyo import read_migrations
+from yoyo.backends import SQLiteBackend
+from yoyo.connections import parse_uri
+
+import database
+from schedule import ScheduleState
+
+
+INDEX_MIGRATION = "20261018_01_Rq4Lm-add-dungeons-entries-indexes"
+STATS_MIGRATION = "20261018_02_Vb7Xe-add-dungeons-entries-stats"
+CHARACTERS = 24
+DAYS_OF_HISTORY = 3 * 365
+
+
+def apply_migrations(db_path, migrations):
+    backend = SQLiteBackend(parse_uri(f"sqlite:///{db_path}"), "_yoyo_migration")
+    backend.init_database()
+    with backend.lock():
+        backend.apply_migrations(backend.to_apply(migrations))
+
+
+def populate(DB, rows):
+    cursor = DB.cursor()
+    cursor.execute("UPDATE characters SET tracking = 1")
+
+    days = ["Sunday", "Monday", "Tuesday", "Wednesday", "Thursday", "Friday", "Saturday"]
+    dungeons = [row[0] for row in cursor.execute("SELECT id FROM dungeons").fetchall()]
+    schedules = [
+        (character_id, day, dungeon_id)
+        for character_id in range(1, CHARACTERS + 1)
+        for day in days
+        for dungeon_id in random.sample(dungeons, 4)
+    ]
+    cursor.executemany(
+        "INSERT INTO character_schedules (character_id, day, dungeon_id) VALUES (?, ?, ?)",
+        schedules)
+
+    now = datetime.datetime.now(datetime.timezone.utc).replace(tzinfo=None)
+    entries = []
+    for _ in range(rows):
+        started_at = now - datetime.timedelta(seconds=random.randint(0, DAYS_OF_HISTORY * 86400))
+        finished_at = started_at + datetime.timedelta(seconds=random.randint(60, 900))
+        entries.append((
+            random.choice(dungeons),
+            random.randint(1, CHARACTERS),
+            started_at.strftime("%Y-%m-%d %H:%M:%S"),
+            finished_at.strftime("%Y-%m-%d %H:%M:%S"),
+        ))
+    cursor.executemany(
+        "INSERT INTO dungeons_entries (dungeon_id, character_id, started_at, finished_at) VALUES (?, ?, ?, ?)",
+        entries)
+    DB.commit()
+
+
+def measure(DB, repeat):
+    schedule = ScheduleState()
+    schedule.reload(DB.cursor())
+    endpoints = {
+        "/dungeons_entries": lambda: database.get_dungeons_entries(DB, None),
+        "/statistics": lambda: database.get_statistics(DB),
+        "/recommend": lambda: schedule.get_recommendation(DB.cursor(), 1, None),
+        "run": lambda: complete_run(DB),
+    }
+
+    timings = {}
+    for (path, request) in endpoints.items():
+        started = time.perf_counter()
+        for _ in range(repeat):
+            request()
+        timings[path] = (time.perf_counter() - started) / repeat * 1000
+    return timings
+
+
+def scan_dungeon_stats(cursor, dungeon_id, character_id, entry_period, reset_day):
+    # get_dungeon_stats before the counters table: two aggregates over dungeons_entries
+    date_filter = database.get_date_filter_sql(entry_period, reset_day)
+    count_query = f"""
+        SELECT COUNT(id) FROM dungeons_entries
+        WHERE dungeon_id = ? AND character_id = ?
+        AND finished_at IS NOT NULL
+        {date_filter}
+    """
+    count = cursor.execute(count_query, (dungeon_id, character_id)).fetchone()[0]
+
+    avg_time_query = """
+        SELECT AVG((julianday(finished_at) - julianday(started_at)) * 86400)
+        FROM dungeons_entries
+        WHERE dungeon_id = ? AND character_id = ?
+        AND finished_at IS NOT NULL
+        AND finished_at != started_at
+    """
+    avg_time = cursor.execute(avg_time_query, (dungeon_id, character_id)).fetchone()[0]
+    return count, avg_time
+
+
+def measure_stats(DB, repeat, stats):
+    # Stats of every character in every dungeon, as /dungeons_entries used to ask for them
+    cursor = DB.cursor()
+    dungeons = cursor.execute("SELECT id, entry_period, reset_day FROM dungeons").fetchall()
+    started = time.perf_counter()
+    for _ in range(repeat):
+        for character_id in range(1, CHARACTERS + 1):
+            for (dungeon_id, entry_period, reset_day) in dungeons:
+                stats(cursor, dungeon_id, character_id, entry_period, reset_day)
+    return (time.perf_counter() - started) / repeat * 1000
+
+
+def complete_run(DB):
+    # What the game loop writes for one run: the unfinished row, then its finish
+    cursor = DB.cursor()
+    (entry_id,) = cursor.execute(
+        "INSERT INTO dungeons_entries (dungeon_id, character_id) VALUES (1, 1) RETURNING id").fetchone()
+    DB.commit()
+    cursor.execute(
+        "UPDATE dungeons_entries SET finished_at = CURRENT_TIMESTAMP, character_id = 1 WHERE id = ?",
+        (entry_id,))
+    DB.commit()
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--rows", type=int, nargs="+", default=[10_000, 100_000, 1_000_000])
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--migrations", type=str, default="./migrations")
+    parser.add_argument("--baseline", action="store_true", help="Also time the stats scans from before the indexes and counters migrations")
+    args = parser.parse_args()
+
+    migrations = read_migrations(args.migrations)
+    series = (INDEX_MIGRATION, STATS_MIGRATION)
+    before = migrations.filter(lambda m: m.id not in series)
+    indexes = migrations.filter(lambda m: m.id == INDEX_MIGRATION)
+
+    timings = {}
+    for rows in args.rows:
+        with tempfile.TemporaryDirectory() as directory:
+            db_path = os.path.join(directory, "oh-my-gc.sqlite3")
+            row = {}
+            if args.baseline:
+                apply_migrations(db_path, before)
+                DB = database.connect(db_path)
+                random.seed(rows)
+                populate(DB, rows)
+                row["stats scan"] = measure_stats(DB, args.repeat, scan_dungeon_stats)
+                DB.close()
+
+                apply_migrations(db_path, indexes)
+                DB = database.connect(db_path)
+                row["stats scan+index"] = measure_stats(DB, args.repeat, scan_dungeon_stats)
+                DB.close()
+
+            # The stats migration backfills its counters from the runs already written
+            apply_migrations(db_path, migrations)
+            DB = database.connect(db_path)
+            if not args.baseline:
+                random.seed(rows)
+                populate(DB, rows)
+            else:
+                row["stats counters"] = measure_stats(DB, args.repeat, database.get_dungeon_stats)
+            row.update(measure(DB, args.repeat))
+            timings[rows] = row
+            DB.close()
+
+    columns = list(next(iter(timings.values())))
+    print(f"{'rows':>10}" + "".join(f" {column:>18}" for column in columns) + "   (ms)")
+    for (rows, row) in timings.items():
+        print(f"{rows:>10}" + "".join(f" {row[column]:>18.1f}" for column in columns))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,78 @@
+"""
+Per-call latency of each available OCR engine on images shaped like the ones
+the game loop reads (result banner, penalty text, boss bar counter), with the
+same configs.
+
+Usage (from the backend directory):
+    python benchmarks/ocr_engines.py --repeat 20 --TESSERACT_PATH /usr/bin/tesseract
+"""
+import os
+import sys
+import time
+import argparse
+
+import cv2
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import ocr
+
+
+# name -> (text, size of the thresholded image, config), as read in game.py
+SAMPLES = {
+    "result_banner": ("COMPLETE", (800, 90), "--oem 3 --psm 6"),
+    "penalty_text": ("Daily runs have been exceeded", (956, 180), "--oem 3 --psm 6"),
+    "boss_bar": ("x0", (285, 45), "--oem 3 --psm 7 -c tessedit_char_whitelist=xXoO0123456789"),
+}
+
+
+def render(text, size):
+    (width, height) = size
+    img = np.zeros((height, width), np.uint8)
+    scale = height / 40
+    (text_width, text_height), _ = cv2.getTextSize(text, cv2.FONT_HERSHEY_DUPLEX, scale, 2)
+    origin = (max(0, (width - text_width) // 2), (height + text_height) // 2)
+    cv2.putText(img, text, origin, cv2.FONT_HERSHEY_DUPLEX, scale, 255, 2, cv2.LINE_AA)
+    return img
+
+
+def measure(engine, img, config, repeat):
+    # The first call pays for loading the model, which a long-lived engine only does once
+    text = engine.image_to_string(img, config=config)
+    timings = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        engine.image_to_string(img, config=config)
+        timings.append((time.perf_counter() - started) * 1000)
+    timings.sort()
+    return (text.strip(), timings[len(timings) // 2], timings[int(len(timings) * 0.95)])
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--repeat", type=int, default=20)
+    parser.add_argument("--TESSERACT_PATH", type=str, default=None)
+    args = parser.parse_args()
+
+    engines = [ocr.PytesseractEngine(args.TESSERACT_PATH)]
+    if ocr.tesserocr is not None:
+        engines.append(ocr.TesserocrEngine(ocr.find_tessdata(args.TESSERACT_PATH)))
+    else:
+        print("tesserocr is not installed, not measuring it\n")
+    library = ocr.find_libtesseract(args.TESSERACT_PATH)
+    if library is not None:
+        engines.append(ocr.LibtesseractEngine(library, ocr.find_tessdata(args.TESSERACT_PATH)))
+    else:
+        print("libtesseract not found, not measuring it\n")
+
+    print(f"{'engine':<12} {'sample':<14} {'p50 (ms)':>9} {'p95 (ms)':>9}  text")
+    for engine in engines:
+        for (name, (text, size, config)) in SAMPLES.items():
+            (read, p50, p95) = measure(engine, render(text, size), config, args.repeat)
+            print(f"{engine.name:<12} {name:<14} {p50:>9.1f} {p95:>9.1f}  {read!r}")
+        engine.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,80 @@
+import gzip
+import threading
+from collections import OrderedDict
+
+from database import REVISION
+from metrics import METRICS
+from schedule import get_logic_date
+
+
+# Bodies smaller than this aren't worth compressing
+GZIP_MIN_SIZE = 1024
+
+
+class ResponseCache:
+    """
+    Serialized JSON responses of the read endpoints, keyed by path and query.
+
+    Responses are versioned by the data revision, which every write bumps, and
+    by the logic day, since entry periods reset when it rolls over. The ETag
+    is that version, so a client that already has the current one is answered
+    without computing or even looking up anything. Cached bodies (and their
+    gzipped copies) are only served while their version is current: a stale
+    one is dropped when it's looked up, and every other stale one once a body
+    of a newer version is stored. At most max_entries bodies are kept, the
+    least recently used going first, since every query string is its own key.
+
+    Lookups are counted in the metrics as response_cache.hits and
+    response_cache.misses.
+    """
+
+    def __init__(self, max_entries=128):
+        self.lock = threading.Lock()
+        self.max_entries = max_entries
+        self.entries = OrderedDict()
+        self.current = None
+
+    def version(self):
+        return f"{REVISION.value}.{get_logic_date():%Y%m%d}"
+
+    def etag(self, version, encoding=None):
+        return f'"{version}-{encoding}"' if encoding else f'"{version}"'
+
+    def get(self, key, version):
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is not None and entry["version"] == version:
+                self.entries.move_to_end(key)
+            else:
+                if entry is not None:
+                    del self.entries[key]
+                entry = None
+
+        METRICS.increment("response_cache.hits" if entry is not None else "response_cache.misses")
+        return entry
+
+    def put(self, key, version, body):
+        entry = {"version": version, "body": body, "gzip": None}
+        with self.lock:
+            if version != self.current:
+                self.current = version
+                for stale in [k for (k, e) in self.entries.items() if e["version"] != version]:
+                    del self.entries[stale]
+            self.entries[key] = entry
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+        return entry
+
+    def encode(self, entry, accept_encoding):
+        """
+        Returns the body to send and its content encoding: gzip if the client
+        accepts it and the body is large enough, compressed once per version.
+        """
+        body = entry["body"]
+        if len(body) < GZIP_MIN_SIZE or "gzip" not in accept_encoding:
+            return (body, None)
+
+        if entry["gzip"] is None:
+            entry["gzip"] = gzip.compress(body, compresslevel=6)
+        return (entry["gzip"], "gzip")
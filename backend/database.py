@@ -1,5 +1,119 @@
 import json
+import time
+import queue
+import sqlite3
 import datetime
+import threading
+import contextlib
+
+
+class Revision:
+    """
+    A counter bumped every time data is committed, used to version responses.
+    It starts from the current time so that versions handed out before a
+    restart are never reused.
+    """
+
+    def __init__(self):
+        self.value = int(time.time() * 1000)
+        self.lock = threading.Lock()
+
+    def bump(self):
+        with self.lock:
+            self.value += 1
+            return self.value
+
+
+REVISION = Revision()
+
+
+class Connection(sqlite3.Connection):
+    # total_changes as of the last commit, to tell writes apart from no-ops
+    committed_changes = 0
+
+
+def commit(DB):
+    """
+    Commits, and bumps the revision if rows were changed since the last commit.
+    The bump comes after the commit, so a revision never labels older data.
+    """
+    if DB.in_transaction:
+        DB.commit()
+    if DB.total_changes != DB.committed_changes:
+        DB.committed_changes = DB.total_changes
+        REVISION.bump()
+
+
+def connect(path, **kwargs):
+    """
+    Opens a connection set up for a long-lived reader/writer: WAL so that readers
+    and the game loop's writes don't block each other, and a busy timeout
+    instead of failing right away when the database is locked.
+    """
+    DB = sqlite3.connect(path, factory=Connection, **kwargs)
+    DB.execute("PRAGMA journal_mode=WAL")
+    DB.execute("PRAGMA synchronous=NORMAL")
+    DB.execute("PRAGMA busy_timeout=5000")
+    return DB
+
+
+class ConnectionPool:
+    """
+    A bounded set of connections shared by the server's request threads.
+    Connections are opened lazily, up to size; past that, requests wait for one
+    to be handed back.
+    """
+
+    def __init__(self, path, size=4):
+        self.path = path
+        self.size = size
+        self.opened = 0
+        self.idle = queue.LifoQueue()
+        self.lock = threading.Lock()
+
+    def acquire(self):
+        try:
+            return self.idle.get_nowait()
+        except queue.Empty:
+            pass
+
+        with self.lock:
+            if self.opened < self.size:
+                self.opened += 1
+                return connect(self.path, check_same_thread=False)
+
+        return self.idle.get()
+
+    def release(self, DB):
+        self.idle.put(DB)
+
+    @contextlib.contextmanager
+    def connection(self):
+        """
+        Lends a connection for the duration of the block, committing on success
+        and rolling back on error.
+        """
+        DB = self.acquire()
+        try:
+            yield DB
+            commit(DB)
+        except BaseException:
+            DB.rollback()
+            raise
+        finally:
+            self.release(DB)
+
+    def close(self):
+        while True:
+            try:
+                self.idle.get_nowait().close()
+            except queue.Empty:
+                break
+
+
+def get_ids_by_name(cursor, table):
+    rows = cursor.execute(f"SELECT name, id FROM {table}").fetchall()
+    return {name: id for (name, id) in rows}
 
 
 def get_current_day_name(cursor):
@@ -9,43 +123,48 @@ def get_current_day_name(cursor):
     return days_map[current_day_index]
 
 
+# Start of every dungeon's current period, as stored in
+# dungeons_entries_stats.period_start ('' for dungeons without a period)
+CURRENT_PERIODS_CTE = """
+    periods AS MATERIALIZED (
+        SELECT
+            id AS dungeon_id,
+            CASE entry_period
+                WHEN 'daily' THEN datetime(date('now', '-6 hours'), '+6 hours')
+                WHEN 'weekly' THEN datetime(date('now', '-6 hours', '-6 days', 'weekday ' || reset_day), '+6 hours')
+                ELSE ''
+            END AS period_start
+        FROM dungeons
+    )
+"""
+
+
+def get_incomplete_tasks(cursor):
+    """
+    Returns the (character_id, dungeon_id) pairs scheduled for today for tracked
+    characters that haven't reached the dungeon's entry limit (or a single run,
+    for dungeons without one) in the current period.
+    """
+    query = f"""
+        WITH {CURRENT_PERIODS_CTE}
+        SELECT c.id, d.id
+        FROM characters c
+        JOIN character_schedules s ON s.character_id = c.id AND s.day = ?
+        JOIN dungeons d ON d.id = s.dungeon_id
+        JOIN periods p ON p.dungeon_id = d.id
+        LEFT JOIN dungeons_entries_stats st
+            ON st.character_id = c.id
+            AND st.dungeon_id = d.id
+            AND st.period_start = p.period_start
+        WHERE c.tracking = 1
+        AND COALESCE(st.completed_count, 0) < CASE WHEN d.entry_limit > 0 THEN d.entry_limit ELSE 1 END
+        ORDER BY c.id
+    """
+    return cursor.execute(query, (get_current_day_name(cursor),)).fetchall()
+
+
 def check_all_tasks_done(cursor):
-    current_day_name = get_current_day_name(cursor)
-    
-    # Get all tracked characters
-    tracked_chars = cursor.execute("SELECT id FROM characters WHERE tracking = 1").fetchall()
-    tracked_ids = [c[0] for c in tracked_chars]
-    
-    all_done = True
-    for char_id_check in tracked_ids:
-        schedule_query = """
-            SELECT dungeon_id FROM character_schedules 
-            WHERE character_id = ? AND day = ?
-        """
-        schedule_rows = cursor.execute(schedule_query, (char_id_check, current_day_name)).fetchall()
-        sch_dungeons = [row[0] for row in schedule_rows]
-        
-        for d_id in sch_dungeons:
-            dungeon_meta_query = "SELECT entry_limit, entry_period, reset_day FROM dungeons WHERE id = ?"
-            dungeon_meta = cursor.execute(dungeon_meta_query, (d_id,)).fetchone()
-            if not dungeon_meta: continue
-            limit, period, r_day = dungeon_meta
-            
-            c, _ = get_dungeon_stats(cursor, d_id, char_id_check, period, r_day)
-            
-            completed = False
-            if limit and limit > 0:
-                if c >= limit: completed = True
-            else:
-                if c >= 1: completed = True
-                
-            if not completed:
-                all_done = False
-                break
-        if not all_done:
-            break
-            
-    return all_done
+    return not get_incomplete_tasks(cursor)
 
 
 def get_date_filter_sql(entry_period, reset_day):
@@ -64,27 +183,55 @@ def get_date_filter_sql(entry_period, reset_day):
     return ""
 
 
+def get_period_start_sql(entry_period, reset_day):
+    # Start of the current period, as stored in dungeons_entries_stats.period_start
+    if entry_period == "daily":
+        return "datetime(date('now', '-6 hours'), '+6 hours')"
+    elif entry_period == "weekly":
+        return f"datetime(date('now', '-6 hours', '-6 days', 'weekday {reset_day}'), '+6 hours')"
+    return "''"
+
+
 def get_dungeon_stats(cursor, dungeon_id, character_id, entry_period, reset_day):
-    date_filter = get_date_filter_sql(entry_period, reset_day)
-    
-    count_query = f"""
-        SELECT COUNT(id) FROM dungeons_entries 
-        WHERE dungeon_id = ? AND character_id = ? 
-        AND finished_at IS NOT NULL
-        {date_filter}
+    period_start = get_period_start_sql(entry_period, reset_day)
+
+    stats_query = f"""
+        SELECT
+            (
+                SELECT completed_count FROM dungeons_entries_stats
+                WHERE character_id = :character_id AND dungeon_id = :dungeon_id
+                AND period_start = {period_start}
+            ),
+            (
+                SELECT total_duration / timed_count FROM dungeons_entries_stats
+                WHERE character_id = :character_id AND dungeon_id = :dungeon_id
+                AND period_start = ''
+            )
     """
-    count = cursor.execute(count_query, (dungeon_id, character_id)).fetchone()[0]
-
-    avg_time_query = """
-        SELECT AVG((julianday(finished_at) - julianday(started_at)) * 86400)
-        FROM dungeons_entries
-        WHERE dungeon_id = ? AND character_id = ?
-        AND finished_at IS NOT NULL
-        AND finished_at != started_at
+    count, avg_time = cursor.execute(
+        stats_query, {"character_id": character_id, "dungeon_id": dungeon_id}).fetchone()
+
+    return count or 0, avg_time
+
+
+def rebuild_dungeon_stats(DB):
     """
-    avg_time = cursor.execute(avg_time_query, (dungeon_id, character_id)).fetchone()[0]
-    
-    return count, avg_time
+    Recomputes dungeons_entries_stats from every run. The triggers on
+    dungeons_entries keep it up to date, so this is only needed if it ever
+    drifts, or after a dungeon's entry period or reset day is changed.
+    """
+    cursor = DB.cursor()
+    cursor.execute("DELETE FROM dungeons_entries_stats")
+    cursor.execute("""
+        INSERT INTO dungeons_entries_stats
+            (character_id, dungeon_id, period_start, completed_count, timed_count, total_duration)
+        SELECT character_id, dungeon_id, period_start, COUNT(*), COUNT(duration), COALESCE(SUM(duration), 0)
+        FROM dungeons_entries_periods
+        WHERE period_start IS NOT NULL
+        GROUP BY character_id, dungeon_id, period_start
+    """)
+    commit(DB)
+    return cursor.rowcount
 
 
 def get_single_dungeon_entry_stats(DB, character_id, dungeon_id):
@@ -101,6 +248,7 @@ def get_single_dungeon_entry_stats(DB, character_id, dungeon_id):
         
         return {
             "dungeonId": dungeon_id,
+            "characterId": character_id,
             "entriesCount": count,
             "avgTime": avg_time
         }
@@ -109,6 +257,21 @@ def get_single_dungeon_entry_stats(DB, character_id, dungeon_id):
         return None
 
 
+def get_dungeon_entry(cursor, entry_id):
+    query = "SELECT id, dungeon_id, character_id, started_at, finished_at FROM dungeons_entries WHERE id = ?"
+    row = cursor.execute(query, (entry_id,)).fetchone()
+    if not row:
+        return None
+
+    return {
+        "id": row[0],
+        "dungeonId": row[1],
+        "characterId": row[2],
+        "startedAt": row[3],
+        "finishedAt": row[4],
+    }
+
+
 def get_dungeons(DB):
     try:
         cursor = DB.cursor()
@@ -131,33 +294,65 @@ def get_dungeons(DB):
         return None
 
 
+def get_period_stats(cursor, character_id=None):
+    """
+    Reads the current period's run count and the average clear time of every
+    (character, dungeon) pair with finished runs, for the given character or
+    every tracked one, from dungeons_entries_stats.
+    """
+    if character_id is not None:
+        character_filter = "c.id = ?"
+        params = (character_id,)
+    else:
+        character_filter = "c.tracking = 1"
+        params = ()
+
+    query = f"""
+        WITH {CURRENT_PERIODS_CTE}
+        SELECT c.id, p.dungeon_id, current.completed_count, total.total_duration / total.timed_count
+        FROM characters c
+        CROSS JOIN periods p
+        JOIN dungeons_entries_stats total
+            ON total.character_id = c.id
+            AND total.dungeon_id = p.dungeon_id
+            AND total.period_start = ''
+        LEFT JOIN dungeons_entries_stats current
+            ON current.character_id = c.id
+            AND current.dungeon_id = p.dungeon_id
+            AND current.period_start = p.period_start
+        WHERE {character_filter}
+    """
+    rows = cursor.execute(query, params).fetchall()
+    return {
+        (char_id, d_id): (count or 0, avg_time)
+        for (char_id, d_id, count, avg_time) in rows
+    }
+
+
 def get_dungeons_entries(DB, character_id):
     try:
         cursor = DB.cursor()
-        dungeons = cursor.execute("SELECT id, entry_period, reset_day FROM dungeons").fetchall()
-        entries_data = []
+        dungeons = cursor.execute("SELECT id FROM dungeons").fetchall()
 
         if character_id is not None:
-            for d_id, entry_period, reset_day in dungeons:
-                count, avg_time = get_dungeon_stats(cursor, d_id, character_id, entry_period, reset_day)
+            character_id = int(character_id)
+            character_ids = [character_id]
+        else:
+            chars = cursor.execute("SELECT id FROM characters WHERE tracking = 1").fetchall()
+            character_ids = [char_row[0] for char_row in chars]
+
+        stats = get_period_stats(cursor, character_id)
+
+        entries_data = []
+        for char_id in character_ids:
+            for (d_id,) in dungeons:
+                count, avg_time = stats.get((char_id, d_id), (0, None))
                 entries_data.append({
                     "dungeonId": d_id,
-                    "characterId": int(character_id),
+                    "characterId": char_id,
                     "entriesCount": count,
                     "avgTime": avg_time
                 })
-        else:
-            chars = cursor.execute("SELECT id FROM characters WHERE tracking = 1").fetchall()
-            for char_row in chars:
-                char_id = char_row[0]
-                for d_id, entry_period, reset_day in dungeons:
-                    count, avg_time = get_dungeon_stats(cursor, d_id, char_id, entry_period, reset_day)
-                    entries_data.append({
-                        "dungeonId": d_id,
-                        "characterId": char_id,
-                        "entriesCount": count,
-                        "avgTime": avg_time
-                    })
 
         return json.dumps({
             "data": entries_data
@@ -167,7 +362,6 @@ def get_dungeons_entries(DB, character_id):
         return None
 
 
-
 def get_characters(DB):
     try:
         cursor = DB.cursor()
@@ -257,7 +451,7 @@ def update_tracked_characters(DB, payload):
             insert_q = "INSERT INTO character_schedules (character_id, day, dungeon_id) VALUES (?, ?, ?)"
             cursor.executemany(insert_q, insert_data)
 
-        DB.commit()
+        commit(DB)
     return json.dumps({"data": response})
 
 
@@ -278,13 +472,8 @@ def update_dungeon_entries(DB, dungeon_id, character_id, value):
  
         date_filter = get_date_filter_sql(entry_period, reset_day)
 
-        query = f"""
-            SELECT count(id) FROM dungeons_entries
-            WHERE dungeon_id = ?
-            AND character_id = ?
-            {date_filter}
-        """
-        count = cursor.execute(query, (dungeon_id, character_id)).fetchone()[0]
+        # Only finished runs are left, so the period count is the stats one
+        count, _ = get_dungeon_stats(cursor, dungeon_id, character_id, entry_period, reset_day)
 
         if value > count:
             diff = value - count
@@ -310,233 +499,114 @@ def update_dungeon_entries(DB, dungeon_id, character_id, value):
             if formatted_ids:
                 placeholders = ','.join(['?'] * len(formatted_ids))
                 cursor.execute(
-                    f"DELETE FROM dungeons_entries WHERE id IN ({
-                        placeholders})",
+                    f"DELETE FROM dungeons_entries WHERE id IN ({placeholders})",
                     formatted_ids
                 )
 
-        DB.commit()
+        commit(DB)
         return json.dumps({"data": "ok"})
     except Exception:
         return None
 
 
+def get_statistics_data(cursor):
+    # All-time totals per character and dungeon are kept in dungeons_entries_stats
+    # 1. Total runs, 2. total time spent (seconds) and 5. global average clear time
+    totals_query = """
+        SELECT
+            COALESCE(SUM(completed_count), 0),
+            COALESCE(SUM(total_duration), 0),
+            COALESCE(SUM(total_duration) / SUM(timed_count), 0)
+        FROM dungeons_entries_stats
+        WHERE period_start = ''
+    """
+    total_runs, total_time_spent, avg_clear_time = cursor.execute(totals_query).fetchone()
+    
+    # 3. Most played dungeon
+    most_played_dungeon_query = """
+        SELECT dungeon_id, SUM(completed_count) as count
+        FROM dungeons_entries_stats
+        WHERE period_start = ''
+        GROUP BY dungeon_id
+        HAVING count > 0
+        ORDER BY count DESC
+        LIMIT 1
+    """
+    most_played_dungeon_row = cursor.execute(most_played_dungeon_query).fetchone()
+    most_played_dungeon = {
+        "id": most_played_dungeon_row[0],
+        "count": most_played_dungeon_row[1]
+    } if most_played_dungeon_row else None
+    
+    # 4. Most played character
+    most_played_character_query = """
+        SELECT character_id, SUM(completed_count) as count
+        FROM dungeons_entries_stats
+        WHERE period_start = ''
+        GROUP BY character_id
+        HAVING count > 0
+        ORDER BY count DESC
+        LIMIT 1
+    """
+    most_played_character_row = cursor.execute(most_played_character_query).fetchone()
+    most_played_character = {
+        "id": most_played_character_row[0],
+        "count": most_played_character_row[1]
+    } if most_played_character_row else None
+
+    return {
+        "totalRuns": total_runs,
+        "totalTimeSpent": total_time_spent,
+        "mostPlayedDungeon": most_played_dungeon,
+        "mostPlayedCharacter": most_played_character,
+        "avgClearTime": avg_clear_time,
+        "isAllDone": check_all_tasks_done(cursor)
+    }
+
+
 def get_statistics(DB):
     try:
-        cursor = DB.cursor()
-        
-        # 1. Total runs
-        total_runs_query = "SELECT COUNT(*) FROM dungeons_entries WHERE finished_at IS NOT NULL"
-        total_runs = cursor.execute(total_runs_query).fetchone()[0]
-        
-        # 2. Total time spent (seconds)
-        total_time_query = """
-            SELECT SUM((julianday(finished_at) - julianday(started_at)) * 86400)
-            FROM dungeons_entries
-            WHERE finished_at IS NOT NULL AND finished_at != started_at
-        """
-        total_time_spent = cursor.execute(total_time_query).fetchone()[0] or 0
-        
-        # 3. Most played dungeon
-        most_played_dungeon_query = """
-            SELECT dungeon_id, COUNT(*) as count
-            FROM dungeons_entries
-            WHERE finished_at IS NOT NULL
-            GROUP BY dungeon_id
-            ORDER BY count DESC
-            LIMIT 1
-        """
-        most_played_dungeon_row = cursor.execute(most_played_dungeon_query).fetchone()
-        most_played_dungeon = {
-            "id": most_played_dungeon_row[0],
-            "count": most_played_dungeon_row[1]
-        } if most_played_dungeon_row else None
-        
-        # 4. Most played character
-        most_played_character_query = """
-            SELECT character_id, COUNT(*) as count
-            FROM dungeons_entries
-            WHERE finished_at IS NOT NULL
-            GROUP BY character_id
-            ORDER BY count DESC
-            LIMIT 1
-        """
-        most_played_character_row = cursor.execute(most_played_character_query).fetchone()
-        most_played_character = {
-            "id": most_played_character_row[0],
-            "count": most_played_character_row[1]
-        } if most_played_character_row else None
-
-        # 5. Global average clear time
-        avg_clear_time_query = """
-            SELECT AVG((julianday(finished_at) - julianday(started_at)) * 86400)
-            FROM dungeons_entries
-            WHERE finished_at IS NOT NULL AND finished_at != started_at
-        """
-        avg_clear_time = cursor.execute(avg_clear_time_query).fetchone()[0] or 0
-
-        return json.dumps({
-            "data": {
-                "totalRuns": total_runs,
-                "totalTimeSpent": total_time_spent,
-                "mostPlayedDungeon": most_played_dungeon,
-                "mostPlayedCharacter": most_played_character,
-                "avgClearTime": avg_clear_time,
-                "isAllDone": check_all_tasks_done(cursor)
-            }
-        })
+        return json.dumps({"data": get_statistics_data(DB.cursor())})
     except Exception as e:
         print(f"Error getting statistics: {e}")
         return None
 
-def get_recommendation(DB, character_id, dungeon_id):
-    try:
-        cursor = DB.cursor()
-        
-        # 1. Determine current logic day (0=Sunday to 6=Saturday, consistent with SQLite %w)
-        # Shift -6 hours to account for reset time
-        # We need to match how `day` is stored in character_schedules.
-        # Assuming `day` matches SQLite strftime('%w', ...): 0=Sunday, 1=Monday...
-        
-        current_day_name = get_current_day_name(cursor)
-        
-        # 2. Get all tracked characters ordered by ID
-        tracked_chars_query = "SELECT id, name FROM characters WHERE tracking = 1 ORDER BY id"
-        tracked_chars = cursor.execute(tracked_chars_query).fetchall()
-        
-        if not tracked_chars:
-            return json.dumps({"data": None})
-            
-        tracked_ids = [c[0] for c in tracked_chars]
-        tracked_map = {c[0]: c[1] for c in tracked_chars}
-        
-        # Determine starting index
-        start_index = 0
-        if character_id is not None and int(character_id) in tracked_ids:
-            start_index = (tracked_ids.index(int(character_id)) + 1) % len(tracked_ids)
-
-        def find_candidate(check_dungeon_id=None):
-            # Iterate through characters cyclically
-            for i in range(len(tracked_ids)):
-                curr_idx = (start_index + i) % len(tracked_ids)
-                curr_char_id = tracked_ids[curr_idx]
-                
-                # STRICTLY exclude the current character
-                if character_id is not None and curr_char_id == int(character_id):
-                    continue
-                
-                # Get schedule for this character for today
-                schedule_query = """
-                    SELECT dungeon_id FROM character_schedules 
-                    WHERE character_id = ? AND day = ?
-                """
-                schedule_rows = cursor.execute(schedule_query, (curr_char_id, current_day_name)).fetchall()
-                scheduled_dungeon_ids = [row[0] for row in schedule_rows]
-                
-                if not scheduled_dungeon_ids:
-                    continue
-                    
-                target_dungeons = []
-                # If we are checking for a specific dungeon
-                if check_dungeon_id is not None:
-                     d_id_int = int(check_dungeon_id)
-                     if d_id_int in scheduled_dungeon_ids:
-                         target_dungeons = [d_id_int]
-                     else:
-                         continue
-                else:
-                    target_dungeons = scheduled_dungeon_ids
-                    
-                # Check completion for each target dungeon
-                for d_id in target_dungeons:
-                    dungeon_meta_query = "SELECT entry_limit, entry_period, reset_day FROM dungeons WHERE id = ?"
-                    dungeon_meta = cursor.execute(dungeon_meta_query, (d_id,)).fetchone()
-                    
-                    if not dungeon_meta:
-                        continue
-                        
-                    entry_limit, entry_period, reset_day = dungeon_meta
-                    
-                    count, _ = get_dungeon_stats(cursor, d_id, curr_char_id, entry_period, reset_day)
-                    
-                    is_completed = False
-                    if entry_limit and entry_limit > 0:
-                        if count >= entry_limit:
-                            is_completed = True
-                    else:
-                        if count >= 1:
-                            is_completed = True
-                            
-                    if not is_completed:
-                        return {
-                            "id": curr_char_id,
-                            "name": tracked_map[curr_char_id]
-                        }
-            return None
-
-        # Pass 1: Try to find someone for the specific dungeon (if provided)
-        recommendation = None
-        if dungeon_id is not None:
-            recommendation = find_candidate(check_dungeon_id=dungeon_id)
-            
-        # Pass 2: If no recommendation yet (or no dungeon_id provided), find ANY next character
-        if recommendation is None:
-            recommendation = find_candidate(check_dungeon_id=None)
-            
-        if recommendation:
-            return json.dumps({
-                "data": {
-                    "recommendation": recommendation,
-                    "isAllDone": False
-                }
-            })
-
-        # If we reached here, no suitable character was found for the request.
-        # Check if ALL schedules are done globally (isAllDone = True)
-        all_done = check_all_tasks_done(cursor)
-        
-        return json.dumps({
-            "data": {
-                "recommendation": None,
-                "isAllDone": all_done
-            }
+def get_inventory_stacks(cursor, stack_ids=None):
+    # Get all items and their stacks with owners, or only the given stacks
+    stack_filter = ""
+    if stack_ids is not None:
+        stack_filter = f"WHERE s.id IN ({', '.join(['?'] * len(stack_ids))})"
+
+    query = f"""
+        SELECT i.id as item_id, i.name, s.quantity, s.id as stack_id, 
+               GROUP_CONCAT(COALESCE(c.id, 'Shared')) as owners,
+               i.is_sharable
+        FROM inventory_stacks s
+        JOIN items i ON s.item_id = i.id
+        JOIN inventory_ownership o ON s.id = o.stack_id
+        LEFT JOIN characters c ON o.character_id = c.id
+        {stack_filter}
+        GROUP BY s.id
+        ORDER BY i.id
+    """
+    rows = cursor.execute(query, stack_ids or ()).fetchall()
+
+    inventory = []
+    for row in rows:
+        inventory.append({
+            "itemId": row[0],
+            "name": row[1],
+            "quantity": row[2],
+            "stackId": row[3],
+            "owners": row[4],
+            "isSharable": bool(row[5])
         })
-        
-    except Exception as e:
-        print(f"Error in get_recommendation: {e}")
-        return json.dumps({"data": {"recommendation": None, "isAllDone": False}})
+    return inventory
 
 
 def get_inventory(DB):
     try:
-        cursor = DB.cursor()
-        
-        # Get all items and their stacks with owners
-        query = """
-            SELECT i.id as item_id, i.name, s.quantity, s.id as stack_id, 
-                   GROUP_CONCAT(COALESCE(c.id, 'Shared')) as owners,
-                   i.is_sharable
-            FROM inventory_stacks s
-            JOIN items i ON s.item_id = i.id
-            JOIN inventory_ownership o ON s.id = o.stack_id
-            LEFT JOIN characters c ON o.character_id = c.id
-            GROUP BY s.id
-            ORDER BY i.id
-        """
-        rows = cursor.execute(query).fetchall()
-
-        inventory = []
-        for row in rows:
-            inventory.append({
-                "itemId": row[0],
-                "name": row[1],
-                "quantity": row[2],
-                "stackId": row[3],
-                "owners": row[4],
-                "isSharable": bool(row[5])
-            })
-            
-        return json.dumps({"data": inventory})
+        return json.dumps({"data": get_inventory_stacks(DB.cursor())})
     except Exception as e:
         print(f"Error in get_inventory: {e}")
         return None
@@ -602,7 +672,7 @@ def update_inventory_item(DB, payload):
         else:
             cursor.execute("UPDATE inventory_stacks SET quantity = ? WHERE id = ?", (final_qty, stack_id))
 
-        DB.commit()
+        commit(DB)
         return json.dumps({"data": "ok"})
     except Exception as e:
         print(f"Error in update_inventory_item: {e}")
@@ -628,11 +698,12 @@ def grant_inventory_item(DB, character_id, item_id, quantity):
         else:
             # Create a fresh stack for the character
             cursor.execute("INSERT INTO inventory_stacks (item_id, quantity) VALUES (?, ?)", (item_id, quantity))
-            new_stack_id = cursor.lastrowid
-            cursor.execute("INSERT INTO inventory_ownership (stack_id, character_id) VALUES (?, ?)", (new_stack_id, character_id))
+            stack_id = cursor.lastrowid
+            cursor.execute("INSERT INTO inventory_ownership (stack_id, character_id) VALUES (?, ?)", (stack_id, character_id))
             
-        DB.commit()
-        return True
+        commit(DB)
+        # The granted stack, so callers can report what changed
+        return stack_id
     except Exception as e:
         print(f"Error in grant_inventory_item: {e}")
         return False
@@ -644,6 +715,8 @@ def grant_void_rewards(DB, character_id, dungeon_id, floor):
     Floor 2: 1 Big, 1 Small
     Floor 3: 2 Big, 2 Small
     Floor 4: 2 Big, 3 Small
+
+    Returns the ids of the granted stacks.
     """
     try:
         # Mapping dungeon_id to (BigFragmentID, SmallFragmentID)
@@ -654,7 +727,7 @@ def grant_void_rewards(DB, character_id, dungeon_id, floor):
         }
         
         if dungeon_id not in mapping:
-            return False
+            return []
             
         big_id, small_id = mapping[dungeon_id]
         
@@ -675,15 +748,16 @@ def grant_void_rewards(DB, character_id, dungeon_id, floor):
             big_qty = 1
             small_qty = 3
             
+        granted = []
         if big_qty > 0:
-            grant_inventory_item(DB, character_id, big_id, big_qty)
+            granted.append(grant_inventory_item(DB, character_id, big_id, big_qty))
         if small_qty > 0:
-            grant_inventory_item(DB, character_id, small_id, small_qty)
+            granted.append(grant_inventory_item(DB, character_id, small_id, small_qty))
             
-        return True
+        return [stack_id for stack_id in granted if stack_id]
     except Exception as e:
         print(f"Error in grant_void_rewards: {e}")
-        return False
+        return []
 
 def get_items(DB):
     try:
@@ -0,0 +1,63 @@
+import cv2
+
+
+class FrameContext:
+    """
+    One captured frame as the detectors see it: its ROIs, their colour
+    conversions and the detectors' results, each computed the first time it's
+    asked for and reused for the rest of the tick.
+
+    Frames are either full images, cropped with rois, or dicts of ROI name to
+    image from region capture.
+    """
+
+    def __init__(self, img, rois, roi_cache=None):
+        self.img = img
+        self.rois = rois
+        self.roi_cache = roi_cache
+        self.images = {}
+        self.results = {}
+
+    def roi(self, name):
+        if isinstance(self.img, dict):
+            return self.img[name]
+        x, y, w, h = self.rois[name]
+        return self.img[y:y+h, x:x+w]
+
+    def convert(self, name, code):
+        """
+        Returns the named ROI converted with cv2.cvtColor(roi, code).
+        """
+        key = (name, code)
+        image = self.images.get(key)
+        if image is None:
+            image = self.images[key] = cv2.cvtColor(self.roi(name), code)
+        return image
+
+    def hsv(self, name):
+        return self.convert(name, cv2.COLOR_BGR2HSV)
+
+    def gray(self, name):
+        return self.convert(name, cv2.COLOR_BGR2GRAY)
+
+    def detect(self, key, compute):
+        """
+        Returns compute(), run at most once per frame for key.
+        """
+        if key not in self.results:
+            self.results[key] = compute()
+        return self.results[key]
+
+    def recognize(self, name, read):
+        """
+        Returns read(roi) for the named ROI, reusing this frame's result or,
+        through the ROI cache, one from an earlier frame where the ROI looked
+        the same.
+        """
+        def compute():
+            roi = self.roi(name)
+            if self.roi_cache is None:
+                return read(roi)
+            return self.roi_cache.recall(name, roi, read)
+
+        return self.detect(("recognize", name), compute)
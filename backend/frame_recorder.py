@@ -0,0 +1,47 @@
+import os
+import time
+import threading
+from collections import deque
+
+import cv2
+
+
+class FrameRecorder:
+    """
+    Keeps the last few captured frames in memory so they can be written to disk
+    when something worth debugging happens, instead of saving every frame.
+
+    Frames are either full images or, with region capture, dicts of region
+    name to image; the latter are saved as one file per region.
+    """
+
+    def __init__(self, directory, size):
+        self.directory = directory
+        self.frames = deque(maxlen=size)
+        self.lock = threading.Lock()
+
+    def record(self, img):
+        with self.lock:
+            self.frames.append((time.time(), img))
+
+    def dump(self, reason):
+        with self.lock:
+            frames = list(self.frames)
+
+        if not frames:
+            return None
+
+        path = os.path.join(
+            self.directory, f"{time.strftime('%Y%m%d-%H%M%S')}-{reason}")
+        os.makedirs(path, exist_ok=True)
+
+        for (index, (timestamp, img)) in enumerate(frames):
+            prefix = f"{index:02d}-{int(timestamp * 1000)}"
+            if isinstance(img, dict):
+                for (name, region) in img.items():
+                    cv2.imwrite(os.path.join(path, f"{prefix}-{name}.png"), region)
+            else:
+                cv2.imwrite(os.path.join(path, f"{prefix}.png"), img)
+
+        print(f"[FrameRecorder]: Saved {len(frames)} frames to {path}")
+        return path
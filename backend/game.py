@@ -1,5 +1,4 @@
 import os
-import pytesseract
 import cv2
 import mss
 import pywinctl as pwc
@@ -9,97 +8,180 @@ import win32gui
 from rapidfuzz import fuzz
 
 from utils import parse_args
+from template_bank import TemplateBank, PyramidBank
+from ocr import create_engine, TextGate
+from metrics import METRICS
+from glyphs import GlyphRecognizer
+from frame_context import FrameContext
 import database
+from schedule import SCHEDULE
 import time
 
 
 LAST_FLOOR_UPDATE = {}
 
+# Name -> id of characters and dungeons, loaded once by load_ids
+CHARACTER_IDS = {}
+DUNGEON_IDS = {}
+
 
 args = parse_args()
-if args.TESSERACT_PATH:
-    pytesseract.pytesseract.tesseract_cmd = args.TESSERACT_PATH
+OCR = create_engine(args.ocr, args.TESSERACT_PATH)
+# The boss counter is too short to tell digits apart as a whole word
+GLYPHS = GlyphRecognizer(
+    os.path.join(args.user_data, "glyphs"), site_accept={"boss_bar": 0.95}, by_glyph={"boss_bar"}
+) if args.word_recognition == "glyphs" else None
 
 
 TEMPLATES_BASE_PATH = args.templates
 
 
-def load_templates(path, gray=False):
-    templates = []
-    for (dirpath, dirnames, filenames) in os.walk(path):
-        for filename in filenames:
-            character_name = filename.replace(".png", "")
-            if gray:
-                templates.append(
-                    (character_name, cv2.imread(
-                        f"{path}/{filename}", cv2.IMREAD_GRAYSCALE))
-                )
-            else:
-                templates.append(
-                    (character_name, cv2.imread(f"{path}/{filename}")))
-    return templates
+# Regions of interest (x, y, w, h) on the 1920x1080 frame
+ROIS = {
+    "lobby_character": (18, 1020, 75, 55),
+    "playing_character": (65, 10, 180, 150),
+    "loading_dungeon": (500, 100, 980, 670),
+    "result_banner": (565, 495, 800, 90),
+    "penalty_text": (1376, 441, 478, 90),
+    "boss_bar": (439, 999, 1139, 45),
+}
+
+
+# Checked on each OCR site's mask before reading it: the result banner is one
+# wide word, the penalty notice a line of several, the boss counter "x0"
+RESULT_BANNER_GATE = TextGate("result_banner", min_pixels=200, min_blobs=1, max_blobs=80, min_aspect=2.0)
+PENALTY_TEXT_GATE = TextGate("penalty_text", min_pixels=100, min_blobs=2, max_blobs=120, min_aspect=2.0)
+BOSS_COUNTER_GATE = TextGate("boss_bar", min_pixels=5, min_blobs=1, max_blobs=8, min_aspect=0.8)
+
+# What each OCR site reads when it's certain, the only reads the glyph
+# recognizer learns from
+RESULT_WORDS = ("COMPLETE", "FAILED")
+PENALTY_PHRASES = (
+    "daily runs have been exceeded",
+    "weekly play count",
+    "penalty has been applied",
+    "penalty in rewards",
+)
+BOSS_COUNTER_WORD = "x0"
 
 
-LOBBY_CHARACTER_TEMPLATES = load_templates(
-    os.path.join(TEMPLATES_BASE_PATH, "characters"))
-INGAME_CHARACTER_TEMPLATES = load_templates(
-    os.path.join(TEMPLATES_BASE_PATH, "characters", "in-game"))
-DUNGEON_TEMPLATES = load_templates(
-    os.path.join(TEMPLATES_BASE_PATH, "dungeons"), gray=True)
+def load_template_bank(path, roi_size, gray=False):
+    if args.template_matching == "pyramid":
+        return PyramidBank(path, roi_size, gray)
+    return TemplateBank(path, roi_size, gray)
+
+
+LOBBY_CHARACTER_TEMPLATES = load_template_bank(
+    os.path.join(TEMPLATES_BASE_PATH, "characters"), (75, 55))
+INGAME_CHARACTER_TEMPLATES = load_template_bank(
+    os.path.join(TEMPLATES_BASE_PATH, "characters", "in-game"), (180, 150))
+DUNGEON_TEMPLATES = load_template_bank(
+    os.path.join(TEMPLATES_BASE_PATH, "dungeons"), (980, 670), gray=True)
+
+
+def load_ids(DB):
+    cursor = DB.cursor()
+    CHARACTER_IDS.update(database.get_ids_by_name(cursor, "characters"))
+    DUNGEON_IDS.update(database.get_ids_by_name(cursor, "dungeons"))
 
 
 class GameState:
-    def __init__(self, character_id, img, DB, broadcaster, has_penalty=False):
+    def __init__(self, character_id, img, DB, broadcaster, has_penalty=False, roi_cache=None):
         self.img = img
         self.character_id = character_id
         self.DB = DB
         self.broadcaster = broadcaster
         self.has_penalty = has_penalty
+        self.frame = FrameContext(img, ROIS, roi_cache)
 
     def __str__(self):
         return f"GameState(\n\tcharacter_id={self.character_id}\n\thas_penalty={self.has_penalty}\n)"
 
+    def roi(self, name):
+        return self.frame.roi(name)
+
+    def recognize(self, name, read):
+        """
+        Runs read on the named ROI once per frame, unless the ROI cache still
+        holds the result for an identical-looking ROI from a previous frame.
+        """
+        return self.frame.recognize(name, read)
+
     def match_ongoing_dungeon(self, entry_id, dungeon_id):
         if self.match_lobby_character():
-            if dungeon_id in [5, 6]:
-                # Lobby completion is always considered a success for these specific dungeons
-                self.complete_dungeon_entry(entry_id, dungeon_id)
-            else:
-                cursor = self.DB.cursor()
-                cursor.execute("DELETE FROM dungeons_entries WHERE finished_at IS NULL")
-                self.DB.commit()
-
+            self.leave_dungeon(entry_id, dungeon_id)
             return True
         else:
-            x, y, w, h = (565, 495, 800, 90)
-            roi = self.img[y:y+h, x:x+w]
-            hsv = cv2.cvtColor(roi, cv2.COLOR_BGR2HSV)
-            lower_yellow = np.array([20, 100, 100])
-            upper_yellow = np.array([35, 255, 255])
-            mask = cv2.inRange(hsv, lower_yellow, upper_yellow)
-            result = cv2.bitwise_and(roi, roi, mask=mask)
-            gray = cv2.cvtColor(result, cv2.COLOR_BGR2GRAY)
-            _, thresh = cv2.threshold(
-                gray, 0, 255, cv2.THRESH_BINARY | cv2.THRESH_OTSU)
-            text = pytesseract.image_to_string(
-                thresh, config="--oem 3 --psm 6")
-
-            if dungeon_id in [10, 11, 12]:
-                if self.match_boss_dead():
-                    now = time.time()
-                    if entry_id not in LAST_FLOOR_UPDATE or now - LAST_FLOOR_UPDATE[entry_id] > 20:
-                        cursor = self.DB.cursor()
-                        cursor.execute("UPDATE dungeons_entries SET floor = COALESCE(floor, 0) + 1 WHERE id = ?", (entry_id,))
-                        self.DB.commit()
-                        LAST_FLOOR_UPDATE[entry_id] = now
-                        print(f"[GameState]: Boss dead detected! Floor increased for entry {entry_id}.")
-
-            if self.is_dungeon_completed(text):
+            is_completed = self.match_result_banner()
+
+            self.match_void_floor(entry_id, dungeon_id)
+
+            if is_completed:
                 self.complete_dungeon_entry(entry_id, dungeon_id)
                 return True
 
             return False
 
+    def leave_dungeon(self, entry_id, dungeon_id):
+        # Returns whether the run counted as completed rather than abandoned
+        if dungeon_id in [5, 6]:
+            # Lobby completion is always considered a success for these specific dungeons
+            self.complete_dungeon_entry(entry_id, dungeon_id)
+            return True
+
+        cursor = self.DB.cursor()
+        cursor.execute("DELETE FROM dungeons_entries WHERE finished_at IS NULL")
+        database.commit(self.DB)
+        return False
+
+    def match_void_floor(self, entry_id, dungeon_id):
+        # Void runs count the floors cleared, one per boss killed
+        if dungeon_id in [10, 11, 12] and self.match_boss_dead():
+            now = time.time()
+            if entry_id not in LAST_FLOOR_UPDATE or now - LAST_FLOOR_UPDATE[entry_id] > 20:
+                cursor = self.DB.cursor()
+                cursor.execute("UPDATE dungeons_entries SET floor = COALESCE(floor, 0) + 1 WHERE id = ?", (entry_id,))
+                database.commit(self.DB)
+                LAST_FLOOR_UPDATE[entry_id] = now
+                print(f"[GameState]: Boss dead detected! Floor increased for entry {entry_id}.")
+
+    def match_result_banner(self):
+        return self.recognize("result_banner", self.read_result_banner)
+
+    def read_result_banner(self, roi):
+        hsv = self.frame.hsv("result_banner")
+        lower_yellow = np.array([20, 100, 100])
+        upper_yellow = np.array([35, 255, 255])
+        mask = cv2.inRange(hsv, lower_yellow, upper_yellow)
+        if not RESULT_BANNER_GATE.passes(mask):
+            return False
+
+        result = cv2.bitwise_and(roi, roi, mask=mask)
+        gray = cv2.cvtColor(result, cv2.COLOR_BGR2GRAY)
+        _, thresh = cv2.threshold(
+            gray, 0, 255, cv2.THRESH_BINARY | cv2.THRESH_OTSU)
+        return self.decide_words("result_banner", thresh, lambda: self.ocr_result_banner(thresh))
+
+    def ocr_result_banner(self, thresh):
+        text = OCR.image_to_string(thresh, config="--oem 3 --psm 6")
+        word = "".join(text.split()).upper()
+        return (self.is_dungeon_completed(text), word if word in RESULT_WORDS else None)
+
+    def decide_words(self, name, thresh, read):
+        """
+        Returns read()'s decision on a binarized ROI, answered from the glyph
+        recognizer's known word images when it can, so OCR only runs on text it
+        hasn't seen. read returns (decision, the vocabulary word OCR read
+        exactly or None).
+        """
+        def read_counted():
+            METRICS.increment(f"ocr.{name}")
+            return read()
+
+        if GLYPHS is None:
+            return read_counted()[0]
+        return GLYPHS.decide(name, thresh, read_counted)
+
     def complete_dungeon_entry(self, entry_id, dungeon_id):
         if entry_id is None:
             return
@@ -117,20 +199,30 @@ class GameState:
             WHERE id = ?
         """
         cursor.execute(update, (self.character_id, entry_id))
-        self.DB.commit()
+        database.commit(self.DB)
+        SCHEDULE.refresh_count(cursor, self.character_id, dungeon_id)
 
         # Grant items if the dungeon was actually completed (not failed) AND no penalty was active
+        granted = []
         if not has_penalty:
             if dungeon_id == 13:
-                database.grant_inventory_item(self.DB, self.character_id, 1, 2)
+                granted.append(database.grant_inventory_item(self.DB, self.character_id, 1, 2))
             elif dungeon_id == 14:
-                database.grant_inventory_item(self.DB, self.character_id, 2, 3)
+                granted.append(database.grant_inventory_item(self.DB, self.character_id, 2, 3))
             elif dungeon_id in [10, 11, 12]:
-                database.grant_void_rewards(self.DB, self.character_id, dungeon_id, floor)
+                granted.extend(database.grant_void_rewards(self.DB, self.character_id, dungeon_id, floor))
+        granted = [stack_id for stack_id in granted if stack_id]
 
+        # Everything the UI shows that this run changed, so it doesn't have to refetch
         self.broadcaster.broadcast(
             event="dungeons",
-            data={"type": "completed_dungeon"}
+            data={
+                "type": "completed_dungeon",
+                "entry": database.get_dungeon_entry(cursor, entry_id),
+                "entries": database.get_single_dungeon_entry_stats(self.DB, self.character_id, dungeon_id),
+                "inventory": database.get_inventory_stacks(cursor, granted) if granted else [],
+                "statistics": database.get_statistics_data(cursor),
+            }
         )
 
     def match_completed_text(self, text):
@@ -160,91 +252,71 @@ class GameState:
         return False
 
     def match_playing_character(self):
-        x, y, w, h = (65, 10, 180, 150)
-        roi = self.img[y:y+h, x:x+w]
-
-        character_match = (0, "")
-
-        for (character_name, template) in INGAME_CHARACTER_TEMPLATES:
-            res = cv2.matchTemplate(roi, template, cv2.TM_CCOEFF_NORMED)
-            min_val, max_val, min_loc, max_loc = cv2.minMaxLoc(res)
-            if max_val > character_match[0]:
-                character_match = (max_val, character_name)
+        character_match = self.recognize(
+            "playing_character", lambda roi: INGAME_CHARACTER_TEMPLATES.match(roi)[0])
 
         threshold = 0.80
         confidence = character_match[0]
         if confidence < 1 and confidence > threshold:
-            character = character_match[1]
-            cursor = self.DB.cursor()
-            character_id = cursor.execute(
-                "SELECT id FROM characters WHERE name = ?",
-                (character,)).fetchone()[0]
+            character_id = CHARACTER_IDS[character_match[1]]
             self.character_id = character_id
             return character_id
 
     def match_loading_dungeon(self, character_id, has_penalty):
         if self.match_playing_character() is None:
-            x, y, w, h = (500, 100, 980, 670)
-            roi = cv2.cvtColor(self.img[y:y + h, x:x + w], cv2.COLOR_BGR2GRAY)
-
-            best_match = (0, "")
-
-            for (dungeon_name, template) in DUNGEON_TEMPLATES:
-                res = cv2.matchTemplate(roi, template, cv2.TM_CCOEFF_NORMED)
-                min_val, max_val, min_loc, max_loc = cv2.minMaxLoc(res)
+            dungeon_id = self.match_loading_screen()
+            if dungeon_id is not None:
+                return (self.start_dungeon_entry(dungeon_id, character_id, has_penalty), dungeon_id)
 
-                if max_val > best_match[0]:
-                    best_match = (max_val, dungeon_name)
+        return None
 
-            threshold = 0.80
-            confidence = best_match[0]
+    def match_loading_screen(self):
+        best_match = self.recognize(
+            "loading_dungeon",
+            lambda roi: DUNGEON_TEMPLATES.match(self.frame.gray("loading_dungeon"))[0])
 
-            if confidence > threshold:
-                dungeon = best_match[1]
-                cursor = self.DB.cursor()
-                cursor.execute(
-                    "DELETE FROM dungeons_entries WHERE finished_at IS NULL")
-                dungeon_id = cursor.execute(
-                    "SELECT id FROM dungeons WHERE name = ?",
-                    (dungeon,)
-                ).fetchone()[0]
-                floor = 1 if dungeon_id in [10, 11, 12] else None
-                entry_id = cursor.execute(
-                    "INSERT INTO dungeons_entries (dungeon_id, character_id, has_penalty, floor) VALUES (?, ?, ?, ?) RETURNING id",
-                    (dungeon_id, character_id, has_penalty, floor)
-                ).fetchone()[0]
-                self.DB.commit()
-                self.broadcaster.broadcast(
-                    event="dungeons",
-                    data={"type": "started_dungeon", "dungeon_id": dungeon_id}
-                )
-                return (entry_id, dungeon_id)
+        threshold = 0.80
+        confidence = best_match[0]
+        if confidence > threshold:
+            return DUNGEON_IDS[best_match[1]]
 
         return None
 
+    def start_dungeon_entry(self, dungeon_id, character_id, has_penalty):
+        cursor = self.DB.cursor()
+        cursor.execute(
+            "DELETE FROM dungeons_entries WHERE finished_at IS NULL")
+        floor = 1 if dungeon_id in [10, 11, 12] else None
+        entry_id = cursor.execute(
+            "INSERT INTO dungeons_entries (dungeon_id, character_id, has_penalty, floor) VALUES (?, ?, ?, ?) RETURNING id",
+            (dungeon_id, character_id, has_penalty, floor)
+        ).fetchone()[0]
+        database.commit(self.DB)
+        self.broadcaster.broadcast(
+            event="dungeons",
+            data={
+                "type": "started_dungeon",
+                "dungeon_id": dungeon_id,
+                "entry": database.get_dungeon_entry(cursor, entry_id),
+            }
+        )
+        return entry_id
+
     def match_lobby_character(self):
-        x, y, w, h = (18, 1020, 75, 55)
-        roi = self.img[y:y+h, x:x+w]
+        # Asked by both the game loop and match_ongoing_dungeon; only runs once per frame
+        return self.frame.detect("lobby_character", self.detect_lobby_character)
 
-        if np.std(roi) < 10:
+    def detect_lobby_character(self):
+        if np.std(self.roi("lobby_character")) < 10:
             return False
 
-        character_match = (0, "")
-
-        for (character_name, template) in LOBBY_CHARACTER_TEMPLATES:
-            res = cv2.matchTemplate(roi, template, cv2.TM_CCOEFF_NORMED)
-            min_val, max_val, min_loc, max_loc = cv2.minMaxLoc(res)
-            if max_val > character_match[0]:
-                character_match = (max_val, character_name)
+        character_match = self.recognize(
+            "lobby_character", lambda roi: LOBBY_CHARACTER_TEMPLATES.match(roi)[0])
 
         threshold = 0.75
         confidence = character_match[0]
         if confidence > threshold:
-            character = character_match[1]
-            cursor = self.DB.cursor()
-            character_id = cursor.execute(
-                "SELECT id FROM characters WHERE name = ?",
-                (character,)).fetchone()[0]
+            character_id = CHARACTER_IDS[character_match[1]]
             self.broadcaster.broadcast(
                 event="dungeons",
                 data={"type": "not_playing"}
@@ -256,11 +328,11 @@ class GameState:
         return None
 
     def match_penalty_text(self):
-        x, y, w, h = (1376, 441, 478, 90)
-        roi = self.img[y:y+h, x:x+w]
+        return self.recognize("penalty_text", self.read_penalty_text)
 
+    def read_penalty_text(self, roi):
         # Convert to HSV for color masking
-        hsv = cv2.cvtColor(roi, cv2.COLOR_BGR2HSV)
+        hsv = self.frame.hsv("penalty_text")
 
         # Color range for the red/orange penalty text
         # Using two ranges for red (it wraps around in HSV)
@@ -276,6 +348,8 @@ class GameState:
         # Dilate the mask slightly to close gaps in letters
         kernel = np.ones((2, 2), np.uint8)
         mask = cv2.dilate(mask, kernel, iterations=1)
+        if not PENALTY_TEXT_GATE.passes(mask):
+            return False
 
         # Bitwise-AND mask and original image to isolate the text
         result = cv2.bitwise_and(roi, roi, mask=mask)
@@ -290,13 +364,18 @@ class GameState:
         thresh = cv2.resize(thresh, None, fx=2, fy=2,
                             interpolation=cv2.INTER_CUBIC)
 
-        # OCR
-        text = pytesseract.image_to_string(thresh, config="--oem 3 --psm 6")
+        return self.decide_words("penalty_text", thresh, lambda: self.ocr_penalty_text(thresh))
+
+    def ocr_penalty_text(self, thresh):
+        text = OCR.image_to_string(thresh, config="--oem 3 --psm 6")
         if len(text.strip()) < 10:
-            text = pytesseract.image_to_string(thresh, config="--oem 3 --psm 3")
+            text = OCR.image_to_string(thresh, config="--oem 3 --psm 3")
 
         if not text:
-            return False
+            return (False, None)
+
+        line = " ".join(text.lower().split())
+        phrase = next((phrase for phrase in PENALTY_PHRASES if phrase in line), None)
 
         # Keywords to check
         keywords = [
@@ -310,32 +389,17 @@ class GameState:
 
         for kw in keywords:
             if fuzz.partial_ratio(text.lower(), kw) >= 75:
-                return True
+                return (True, phrase)
 
-        return False
-
-    def has_colors(self, roi, color_ranges):
-        """
-        Generic helper to check if an ROI contains any of the specified color ranges.
-        color_ranges: list of tuples ((lower_hsv), (upper_hsv))
-        """
-        hsv = cv2.cvtColor(roi, cv2.COLOR_BGR2HSV)
-        for (lower, upper) in color_ranges:
-            lower = np.array(lower)
-            upper = np.array(upper)
-            mask = cv2.inRange(hsv, lower, upper)
-            if cv2.countNonZero(mask) > (roi.shape[0] * roi.shape[1] * 0.05): # At least 5% of pixels
-                return True
-        return False
+        return (False, None)
 
     def match_boss_dead(self):
+        return self.recognize("boss_bar", self.read_boss_dead)
+
+    def read_boss_dead(self, roi):
         """
         Detects if the boss is dead by checking for 'x0' text and empty health bar.
         """
-        # ROI for boss health bar (centered at the top, based on 1920x1080)
-        x, y, w, h = (439, 999, 1139, 45)
-        roi = self.img[y:y+h, x:x+w]
-
         # 1. Color Check
         # Alive or non-dead colors: 
         # - Cyan/Blue (Saturation > 80, centered on Cyan Hue 90)
@@ -376,13 +440,16 @@ class GameState:
         white_pixels = cv2.countNonZero(thresh)
         total_pixels = thresh.shape[0] * thresh.shape[1]
         
-        if white_pixels > total_pixels * 0.4 or white_pixels < 5:
+        if white_pixels > total_pixels * 0.4 or not BOSS_COUNTER_GATE.passes(thresh):
             return False
             
         kernel = np.ones((2, 2), np.uint8)
         thresh = cv2.dilate(thresh, kernel, iterations=1)
         
-        text = pytesseract.image_to_string(thresh, config="--oem 3 --psm 7 -c tessedit_char_whitelist=xXoO0123456789").strip().lower()
+        return self.decide_words("boss_bar", thresh, lambda: self.ocr_boss_counter(thresh))
+
+    def ocr_boss_counter(self, thresh):
+        text = OCR.image_to_string(thresh, config="--oem 3 --psm 7 -c tessedit_char_whitelist=xXoO0123456789").strip().lower()
         
         matched = False
         # Very strict matching: requires an 'x' AND a '0' or 'o'
@@ -392,7 +459,7 @@ class GameState:
             elif text in ["x.0", "x.o", "x:0", "x:o", "xo", "x0"]:
                 matched = True
         
-        return matched
+        return (matched, BOSS_COUNTER_WORD if text == BOSS_COUNTER_WORD else None)
 
 
 def get_window():
@@ -410,11 +477,11 @@ def get_window():
 def capture_template(template_name, template_type):
     with mss.mss() as sct:
         if template_type == "characters":
-            x, y, w, h = (18, 1020, 75, 55)
+            x, y, w, h = ROIS["lobby_character"]
         elif template_type == "dungeon":
-            x, y, w, h = (500, 100, 980, 670)
+            x, y, w, h = ROIS["loading_dungeon"]
         elif template_type == "in-game":
-            x, y, w, h = (65, 10, 180, 150)
+            x, y, w, h = ROIS["playing_character"]
         else:
             raise Exception("Invalid template type")
 
@@ -432,7 +499,11 @@ def capture_template(template_name, template_type):
         mss.tools.to_png(screenshot.rgb, screenshot.size, output=path)
 
 
-def take_screenshot(window, image_path):
+def get_client_area(window):
+    """
+    Returns the (x, y, w, h) screen rectangle of the window's client area, or
+    None if it has no area (e.g. minimized).
+    """
     hwnd = window.getHandle()
 
     # Get the client area size
@@ -444,8 +515,15 @@ def take_screenshot(window, image_path):
         return None
 
     # Get the screen coordinates of the top-left corner of the client area
-    top_left = win32gui.ClientToScreen(hwnd, (0, 0))
-    x, y = top_left
+    x, y = win32gui.ClientToScreen(hwnd, (0, 0))
+    return (x, y, w, h)
+
+
+def take_screenshot(window):
+    client_area = get_client_area(window)
+    if client_area is None:
+        return None
+    x, y, w, h = client_area
 
     with mss.mss() as sct:
         # Capture the specified region
@@ -466,6 +544,76 @@ def take_screenshot(window, image_path):
     if img.shape[0] != 1080 or img.shape[1] != 1920:
         img = cv2.resize(img, (1920, 1080))
 
-    cv2.imwrite(image_path, img)
-
     return img
+
+
+def contains(outer, inner):
+    ox, oy, ow, oh = outer
+    ix, iy, iw, ih = inner
+    return ox <= ix and oy <= iy and ix + iw <= ox + ow and iy + ih <= oy + oh
+
+
+def take_regions(window, regions=ROIS):
+    """
+    Captures only the given regions instead of the whole client area.
+
+    Regions are (x, y, w, h) rectangles on the 1920x1080 reference frame; each
+    one is mapped to the window's actual client coordinates, grabbed on its own
+    and scaled back to its reference size, so capture and conversion cost scale
+    with the regions' area. Regions lying inside another one are cropped from it
+    instead of being grabbed again.
+
+    Returns a dict of region name to BGR image.
+    """
+    client_area = get_client_area(window)
+    if client_area is None:
+        return None
+    x, y, w, h = client_area
+    scale_x = w / 1920
+    scale_y = h / 1080
+
+    # Largest first, so that nested regions find their container already captured
+    ordered = sorted(regions.items(), key=lambda item: item[1][2] * item[1][3], reverse=True)
+
+    captured = {}
+    with mss.mss() as sct:
+        for (name, rect) in ordered:
+            container = next(
+                (other for other in captured if contains(regions[other], rect)), None)
+            if container is not None:
+                cx, cy, _, _ = regions[container]
+                rx, ry, rw, rh = rect
+                captured[name] = captured[container][ry-cy:ry-cy+rh, rx-cx:rx-cx+rw]
+                continue
+
+            # Grab the client pixels under the region, with a pixel of margin
+            # for interpolation
+            rx, ry, rw, rh = rect
+            left = max(0, int(rx * scale_x) - 1)
+            top = max(0, int(ry * scale_y) - 1)
+            right = min(w, int(np.ceil((rx + rw) * scale_x)) + 1)
+            bottom = min(h, int(np.ceil((ry + rh) * scale_y)) + 1)
+            screenshot = sct.grab({
+                "top": y + top,
+                "left": x + left,
+                "width": right - left,
+                "height": bottom - top
+            })
+            img = cv2.cvtColor(np.array(screenshot), cv2.COLOR_BGRA2BGR)
+
+            if scale_x == 1 and scale_y == 1:
+                img = img[ry-top:ry-top+rh, rx-left:rx-left+rw]
+            else:
+                # Same pixel mapping as resizing the whole client area to
+                # 1920x1080, restricted to this region
+                transform = np.array([
+                    [scale_x, 0, (rx + 0.5) * scale_x - 0.5 - left],
+                    [0, scale_y, (ry + 0.5) * scale_y - 0.5 - top],
+                ])
+                img = cv2.warpAffine(
+                    img, transform, (rw, rh),
+                    flags=cv2.INTER_LINEAR | cv2.WARP_INVERSE_MAP,
+                    borderMode=cv2.BORDER_REPLICATE)
+            captured[name] = img
+
+    return captured
@@ -0,0 +1,244 @@
+import os
+import re
+import time
+
+import cv2
+import numpy as np
+
+from template_bank import normalize
+from metrics import METRICS
+
+
+class WordShapes:
+    """
+    The word images seen so far for one reader, each with the decision OCR
+    made on it. A word image is a stack of glyph vectors (a single one for
+    readers that look at the whole word), and only images with as many glyphs
+    are compared, scoring the glyph that matches worst. Positives are kept
+    with the file they're saved in, if any; negatives are only remembered for
+    the most recent ones.
+    """
+
+    def __init__(self, max_positives, max_negatives):
+        self.max_positives = max_positives
+        self.max_negatives = max_negatives
+        self.positives = []
+        self.negatives = []
+        # Glyph count -> (matrix, decisions, index in positives or None)
+        self.groups = {}
+
+    def add(self, glyphs, decision, path=None):
+        # Returns whether a new positive was kept
+        if decision:
+            if len(self.positives) >= self.max_positives:
+                return False
+            self.positives.append((glyphs, path))
+        else:
+            self.negatives.append(glyphs)
+            del self.negatives[:-self.max_negatives]
+
+        self.rebuild()
+        return decision
+
+    def remove(self, index):
+        # Returns the file the positive was saved in
+        (_, path) = self.positives.pop(index)
+        self.rebuild()
+        return path
+
+    def rebuild(self):
+        entries = {}
+        for (index, (glyphs, _)) in enumerate(self.positives):
+            entries.setdefault(len(glyphs), []).append((glyphs, True, index))
+        for glyphs in self.negatives:
+            entries.setdefault(len(glyphs), []).append((glyphs, False, None))
+
+        self.groups = {
+            count: (
+                np.stack([glyphs for (glyphs, _, _) in group]),
+                [decision for (_, decision, _) in group],
+                [index for (_, _, index) in group],
+            )
+            for (count, group) in entries.items()
+        }
+
+    def best(self, glyphs):
+        """
+        Returns (decision, score, positive index) of the closest word image,
+        or (None, 0.0, None) if none has as many glyphs.
+        """
+        group = self.groups.get(len(glyphs))
+        if group is None:
+            return (None, 0.0, None)
+
+        (matrix, decisions, indexes) = group
+        scores = np.einsum("nkd,kd->nk", matrix, glyphs).min(axis=1)
+        best = int(np.argmax(scores))
+        return (decisions[best], float(scores[best]), indexes[best])
+
+
+class GlyphRecognizer:
+    """
+    Answers the yes/no questions the game loop asks OCR ("is this the result
+    banner?", "is the boss counter at x0?", "is there a penalty notice?") by
+    comparing the binarized ROI with word images OCR already decided on.
+
+    A word image is the binarized ROI cropped to its ink and scaled to a fixed
+    size, so the same text matches wherever it sits in the ROI. For readers in
+    by_glyph it's each connected component (glyph) scaled on its own instead,
+    so that short text like "x0" can't be mistaken for "x8". An ROI with no
+    ink holds no word. Otherwise the closest known word image decides if it
+    scores at least the reader's accept (site_accept, falling back to accept),
+    or negative_accept for negatives: a frame that OCR said no to (say, the
+    banner still fading in) must look practically the same to be answered no
+    again. Anything else runs OCR as before.
+
+    Only word images OCR read as an exact vocabulary word are learned as
+    positives (a lenient match is still answered yes, but not remembered),
+    and they're saved to directory, named after the word, and loaded back on
+    start so later runs skip OCR from the first frame. Every verify_every-th
+    yes answered from a learned image is checked with OCR again, and an image
+    OCR says no to is forgotten and its file deleted.
+
+    Decisions are counted in the metrics as glyphs.<name>.recognized (no OCR),
+    glyphs.<name>.fallbacks (OCR ran), glyphs.<name>.learned and
+    glyphs.<name>.forgotten.
+    """
+
+    def __init__(self, directory=None, size=(96, 24), glyph_size=(16, 24), accept=0.85,
+                 negative_accept=0.95, site_accept=None, by_glyph=(), verify_every=20,
+                 min_glyph_area=4, max_positives=32, max_negatives=64):
+        self.directory = directory
+        self.size = size
+        self.glyph_size = glyph_size
+        self.accept = accept
+        self.negative_accept = negative_accept
+        self.site_accept = site_accept or {}
+        self.by_glyph = set(by_glyph)
+        self.verify_every = verify_every
+        self.min_glyph_area = min_glyph_area
+        self.max_positives = max_positives
+        self.max_negatives = max_negatives
+        self.shapes = {}
+        self.answered = {}
+        if directory is not None:
+            self.load()
+
+    def words(self, name):
+        shapes = self.shapes.get(name)
+        if shapes is None:
+            shapes = self.shapes[name] = WordShapes(self.max_positives, self.max_negatives)
+        return shapes
+
+    def word_images(self, name, binary):
+        """
+        Returns the images the named reader compares for a binarized ROI: the
+        whole word, or each glyph from left to right. Empty if there's no ink.
+        """
+        if name not in self.by_glyph:
+            points = cv2.findNonZero(binary)
+            if points is None:
+                return []
+            (x, y, w, h) = cv2.boundingRect(points)
+            return [cv2.resize(binary[y:y+h, x:x+w], self.size, interpolation=cv2.INTER_AREA)]
+
+        count, labels, stats, _ = cv2.connectedComponentsWithStats(binary, connectivity=8)
+        # Row 0 is the background
+        glyphs = sorted(
+            (stats[label, cv2.CC_STAT_LEFT], label) for label in range(1, count)
+            if stats[label, cv2.CC_STAT_AREA] >= self.min_glyph_area
+        )
+        images = []
+        for (_, label) in glyphs:
+            (x, y, w, h) = stats[label, :4]
+            glyph = np.where(labels[y:y+h, x:x+w] == label, 255, 0).astype(np.uint8)
+            images.append(cv2.resize(glyph, self.glyph_size, interpolation=cv2.INTER_AREA))
+        return images
+
+    def decide(self, name, binary, fallback):
+        """
+        Returns the decision for the binarized ROI, calling fallback() (the OCR
+        read) only when no known word image is close enough. fallback returns
+        (decision, word), word being the vocabulary word OCR read exactly or
+        None.
+        """
+        images = self.word_images(name, binary)
+        if not images:
+            METRICS.increment(f"glyphs.{name}.recognized")
+            return False
+
+        glyphs = np.stack([normalize(image) for image in images])
+        shapes = self.words(name)
+        (decision, score, index) = shapes.best(glyphs)
+        accept = self.site_accept.get(name, self.accept) if decision else self.negative_accept
+        verify = False
+        if decision is not None and score >= accept:
+            if decision:
+                self.answered[name] = self.answered.get(name, 0) + 1
+                verify = self.answered[name] % self.verify_every == 0
+            if not verify:
+                METRICS.increment(f"glyphs.{name}.recognized")
+                return decision
+
+        METRICS.increment(f"glyphs.{name}.fallbacks")
+        (decision, word) = fallback()
+        decision = bool(decision)
+        if verify:
+            if not decision:
+                self.forget(name, index)
+            return decision
+        if decision and (word is None or len(shapes.positives) >= self.max_positives):
+            return decision
+
+        shapes.add(glyphs, decision, self.save(name, word, images) if decision else None)
+        if decision:
+            METRICS.increment(f"glyphs.{name}.learned")
+        return decision
+
+    def forget(self, name, index):
+        path = self.words(name).remove(index)
+        METRICS.increment(f"glyphs.{name}.forgotten")
+        print(f"[GlyphRecognizer]: OCR disagreed with a known {name} word image, forgetting it")
+        if path is not None:
+            self.delete(path)
+
+    def save(self, name, word, images):
+        if self.directory is None:
+            return None
+        path = os.path.join(self.directory, name)
+        filename = f"{re.sub(r'[^A-Za-z0-9]+', '_', word)}-{int(time.time() * 1000)}.png"
+        try:
+            os.makedirs(path, exist_ok=True)
+            cv2.imwrite(os.path.join(path, filename), np.hstack(images))
+            return os.path.join(path, filename)
+        except Exception as e:
+            print(f"[GlyphRecognizer]: Could not save word image: {e}")
+            return None
+
+    def delete(self, path):
+        try:
+            os.remove(path)
+        except OSError as e:
+            print(f"[GlyphRecognizer]: Could not delete word image: {e}")
+
+    def load(self):
+        if not os.path.isdir(self.directory):
+            return
+        count = 0
+        for name in sorted(os.listdir(self.directory)):
+            path = os.path.join(self.directory, name)
+            if not os.path.isdir(path):
+                continue
+            (width, height) = self.glyph_size if name in self.by_glyph else self.size
+            for filename in sorted(os.listdir(path)):
+                # Images are named after the word OCR read; unnamed ones predate that check
+                if not filename.endswith(".png") or "-" not in filename:
+                    continue
+                image = cv2.imread(os.path.join(path, filename), cv2.IMREAD_GRAYSCALE)
+                if image is None or image.shape[0] != height or image.shape[1] % width:
+                    continue
+                if name not in self.by_glyph and image.shape[1] != width:
+                    continue
+                glyphs = np.stack([normalize(glyph) for glyph in np.hsplit(image, image.shape[1] // width)])
+                count += self.words(name).add(glyphs, True, os.path.join(path, filename))
+        print(f"[GlyphRecognizer]: Loaded {count} word images from {self.directory}")
@@ -1,19 +1,24 @@
 import time
 import threading
-import sqlite3
 import socketserver
 import signal
 import psutil
 from functools import partial
 
 from game import GameState
+from phase import GamePhase
 import game
+import database
 from sse import SSEBroadcaster
+from roi_cache import RoiCache
+from frame_recorder import FrameRecorder
+from cache import ResponseCache
 from yoyo import read_migrations
 from yoyo.backends import SQLiteBackend
 from yoyo.connections import parse_uri
 from utils import parse_args
 from server import Handler
+from async_server import AsyncServer
 
 
 shutdown_event = threading.Event()
@@ -49,64 +54,90 @@ def monitor_parent():
         print(f"[main]: Error monitoring parent: {e}")
 
 
-def game_loop(args, broadcaster):
+def game_loop(args, broadcaster, recorder=None):
     dungeon_entry_id = None
     dungeon_id = None
     last_character_id = None
     has_penalty = False
     last_window_status = None
+    roi_cache = RoiCache()
+    phase = GamePhase(recorder) if args.detection == "phases" else None
     print("[game_loop]: Starting game loop...")
 
-    while not shutdown_event.is_set():
-        if shutdown_event.wait(timeout=0.5):
-            break
+    # One connection for the lifetime of the loop; each tick is committed as a unit
+    DB = database.connect(f"{args.user_data}/oh-my-gc.sqlite3")
+    try:
+        game.load_ids(DB)
 
-        with sqlite3.connect(f"{args.user_data}/oh-my-gc.sqlite3") as DB:
-            window = game.get_window()
+        while not shutdown_event.is_set():
+            if shutdown_event.wait(timeout=0.5):
+                break
+
+            with DB:
+                window = game.get_window()
             
-            # Visibility logic: Window exists, is not minimized, and is active (focused)
-            is_visible = False
-            if window is not None:
-                try:
-                    is_visible = not window.isMinimized and window.isActive
-                except Exception:
-                    is_visible = False
-
-            if is_visible != last_window_status:
+                # Visibility logic: Window exists, is not minimized, and is active (focused)
+                is_visible = False
+                if window is not None:
+                    try:
+                        is_visible = not window.isMinimized and window.isActive
+                    except Exception:
+                        is_visible = False
+
+                if is_visible != last_window_status:
+                    broadcaster.broadcast(
+                        event="window_status",
+                        data={"visible": is_visible}
+                    )
+                    last_window_status = is_visible
+
+                if not is_visible:
+                    continue
+
+                if args.capture == "regions":
+                    img = game.take_regions(window)
+                else:
+                    img = game.take_screenshot(window)
+                if img is None:
+                    continue
+
+                if recorder is not None:
+                    recorder.record(img)
+
+                game_state = GameState(last_character_id, img, DB, broadcaster, has_penalty, roi_cache)
+
+                if phase is not None:
+                    phase.step(game_state)
+                    if game_state.character_id is not None:
+                        last_character_id = game_state.character_id
+                        has_penalty = game_state.has_penalty
+                else:
+                    game_state.match_lobby_character()
+                    if game_state.character_id is not None:
+                        last_character_id = game_state.character_id
+                        has_penalty = game_state.has_penalty
+
+                    entry = game_state.match_loading_dungeon(last_character_id, has_penalty)
+                    if entry is not None:
+                        (dungeon_entry_id, dungeon_id) = entry
+                        if recorder is not None:
+                            recorder.dump("started_dungeon")
+
+                    is_completed = game_state.match_ongoing_dungeon(dungeon_entry_id, dungeon_id)
+                    if is_completed:
+                        if recorder is not None and dungeon_entry_id is not None:
+                            recorder.dump("completed_dungeon")
+                        dungeon_id = None
+                        dungeon_entry_id = None
+
                 broadcaster.broadcast(
-                    event="window_status",
-                    data={"visible": is_visible}
+                    event="character",
+                    data=game_state.character_id
                 )
-                last_window_status = is_visible
-
-            if not is_visible:
-                continue
-
-            img = game.take_screenshot(window, f"{args.user_data}/screenshot.png")
-            if img is None:
-                continue
-
-            game_state = GameState(last_character_id, img, DB, broadcaster, has_penalty)
-
-            game_state.match_lobby_character()
-            if game_state.character_id is not None:
-                last_character_id = game_state.character_id
-                has_penalty = game_state.has_penalty
-
-            entry = game_state.match_loading_dungeon(last_character_id, has_penalty)
-            if entry is not None:
-                (dungeon_entry_id, dungeon_id) = entry
-
-            is_completed = game_state.match_ongoing_dungeon(dungeon_entry_id, dungeon_id)
-            if is_completed:
-                dungeon_id = None
-                dungeon_entry_id = None
-
-            broadcaster.broadcast(
-                event="character",
-                data=game_state.character_id
-            )
-
+    finally:
+        # Also on errors, so neither the connection nor the OCR engine leaks
+        DB.close()
+        game.OCR.close()
     print("[game_loop]: Game loop has shut down")
 
 
@@ -147,15 +178,32 @@ def main():
 
     run_migrations(args)
 
+    if args.rebuild_stats:
+        DB = database.connect(f"{args.user_data}/oh-my-gc.sqlite3")
+        rows = database.rebuild_dungeon_stats(DB)
+        DB.close()
+        print(f"[main]: Rebuilt dungeon stats ({rows} rows)")
+        return
+
     broadcaster = SSEBroadcaster()
-    handler = partial(Handler, broadcaster=broadcaster)
-    httpd = socketserver.ThreadingTCPServer(("", args.port), handler)
-    httpd.daemon_threads = True
-    print(f"[main]: Serving at http://localhost:{args.port}")
+    recorder = None
+    if args.debug_frames > 0:
+        recorder = FrameRecorder(f"{args.user_data}/frames", args.debug_frames)
+
+    cache = ResponseCache()
+
+    pool = database.ConnectionPool(f"{args.user_data}/oh-my-gc.sqlite3")
+    if args.server == "asyncio":
+        httpd = AsyncServer(("", args.port), broadcaster, pool, recorder=recorder, cache=cache)
+    else:
+        handler = partial(Handler, broadcaster=broadcaster, pool=pool, recorder=recorder, cache=cache)
+        httpd = socketserver.ThreadingTCPServer(("", args.port), handler)
+        httpd.daemon_threads = True
+    print(f"[main]: Serving at http://localhost:{args.port} ({args.server})")
 
     run_server = threading.Thread(target=server, args=(httpd,))
     run_game_loop = threading.Thread(
-        target=game_loop, args=(args, broadcaster), daemon=True
+        target=game_loop, args=(args, broadcaster, recorder), daemon=True
     )
 
     # Start parent monitor if we have a parent PID
@@ -180,6 +228,7 @@ def main():
         run_game_loop.join()
         if parent_monitor is not None:
             parent_monitor.join()
+        pool.close()
 
 
 if __name__ == "__main__":
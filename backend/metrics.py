@@ -0,0 +1,70 @@
+import threading
+from collections import deque
+
+
+class RouteMetrics:
+    def __init__(self, samples):
+        self.count = 0
+        self.errors = 0
+        self.total_ms = 0.0
+        self.max_ms = 0.0
+        self.recent = deque(maxlen=samples)
+
+    def observe(self, elapsed_ms, failed):
+        self.count += 1
+        self.errors += failed
+        self.total_ms += elapsed_ms
+        self.max_ms = max(self.max_ms, elapsed_ms)
+        self.recent.append(elapsed_ms)
+
+    def snapshot(self):
+        recent = sorted(self.recent)
+        return {
+            "count": self.count,
+            "errors": self.errors,
+            "avgMs": round(self.total_ms / self.count, 2) if self.count else 0,
+            "p50Ms": round(percentile(recent, 0.5), 2),
+            "p95Ms": round(percentile(recent, 0.95), 2),
+            "maxMs": round(self.max_ms, 2),
+        }
+
+
+def percentile(values, fraction):
+    if not values:
+        return 0
+    return values[min(len(values) - 1, int(len(values) * fraction))]
+
+
+class Metrics:
+    """
+    Request latencies per route, recorded by the server's dispatch, and plain
+    counters anything else can bump (e.g. the game loop's OCR gates). Totals
+    cover the whole run; percentiles only the most recent requests.
+    """
+
+    def __init__(self, samples=512):
+        self.lock = threading.Lock()
+        self.samples = samples
+        self.routes = {}
+        self.counters = {}
+
+    def increment(self, name, amount=1):
+        with self.lock:
+            self.counters[name] = self.counters.get(name, 0) + amount
+
+    def observe(self, route, elapsed_ms, failed=False):
+        with self.lock:
+            metrics = self.routes.get(route)
+            if metrics is None:
+                metrics = self.routes[route] = RouteMetrics(self.samples)
+            metrics.observe(elapsed_ms, failed)
+
+    def snapshot(self):
+        with self.lock:
+            return {
+                "routes": {route: metrics.snapshot() for (route, metrics) in sorted(self.routes.items())},
+                "counters": dict(sorted(self.counters.items())),
+            }
+
+
+METRICS = Metrics()
@@ -0,0 +1,20 @@
+-- add dungeons_entries indexes
+-- depends: 20260108_01_NkDqU-add-penalty-check-to-dungeons-entries
+
+-- Runs of a character in a dungeon within a period (entry counts when editing runs)
+CREATE INDEX IF NOT EXISTS idx_dungeons_entries_character_dungeon
+ON dungeons_entries (character_id, dungeon_id, started_at);
+
+-- Same lookup restricted to finished runs, also covering finished_at so that
+-- period counts and average clear times never touch the table
+CREATE INDEX IF NOT EXISTS idx_dungeons_entries_finished
+ON dungeons_entries (character_id, dungeon_id, started_at, finished_at)
+WHERE finished_at IS NOT NULL;
+
+-- Unfinished runs, cleared whenever a dungeon starts or the lobby is seen
+CREATE INDEX IF NOT EXISTS idx_dungeons_entries_unfinished
+ON dungeons_entries (character_id, dungeon_id)
+WHERE finished_at IS NULL;
+
+CREATE INDEX IF NOT EXISTS idx_character_schedules_character_day
+ON character_schedules (character_id, day);
@@ -0,0 +1,125 @@
+-- add dungeons_entries stats
+-- depends: 20260108_01_NkDqU-add-penalty-check-to-dungeons-entries 20261018_01_Rq4Lm-add-dungeons-entries-indexes
+
+-- Finished runs of a character in a dungeon, counted per entry period.
+-- The row with an empty period_start holds the all-time totals; dungeons
+-- without an entry period only have that row.
+CREATE TABLE IF NOT EXISTS dungeons_entries_stats (
+    character_id INTEGER NOT NULL,
+    dungeon_id INTEGER NOT NULL,
+    period_start TEXT NOT NULL,
+    completed_count INTEGER NOT NULL DEFAULT 0,
+    timed_count INTEGER NOT NULL DEFAULT 0,
+    total_duration REAL NOT NULL DEFAULT 0,
+    PRIMARY KEY (character_id, dungeon_id, period_start)
+) WITHOUT ROWID;
+
+-- All-time rows, read by /statistics
+CREATE INDEX IF NOT EXISTS idx_dungeons_entries_stats_period_start
+ON dungeons_entries_stats (period_start);
+
+-- Every finished run once for the all-time totals and once for the period it
+-- was started in. Periods start at 06:00 UTC, like get_date_filter_sql's windows.
+-- duration is NULL for runs that were entered by hand (finished_at = started_at).
+CREATE VIEW IF NOT EXISTS dungeons_entries_periods AS
+SELECT
+    e.id,
+    e.character_id,
+    e.dungeon_id,
+    '' AS period_start,
+    CASE
+        WHEN e.finished_at != e.started_at
+        THEN (julianday(e.finished_at) - julianday(e.started_at)) * 86400
+    END AS duration
+FROM dungeons_entries e
+WHERE e.finished_at IS NOT NULL
+UNION ALL
+SELECT
+    e.id,
+    e.character_id,
+    e.dungeon_id,
+    CASE d.entry_period
+        WHEN 'daily' THEN datetime(date(e.started_at, '-6 hours'), '+6 hours')
+        WHEN 'weekly' THEN datetime(date(e.started_at, '-6 hours', '-6 days', 'weekday ' || d.reset_day), '+6 hours')
+    END AS period_start,
+    CASE
+        WHEN e.finished_at != e.started_at
+        THEN (julianday(e.finished_at) - julianday(e.started_at)) * 86400
+    END AS duration
+FROM dungeons_entries e
+JOIN dungeons d ON d.id = e.dungeon_id
+WHERE e.finished_at IS NOT NULL
+AND d.entry_period IS NOT NULL;
+
+INSERT INTO dungeons_entries_stats
+    (character_id, dungeon_id, period_start, completed_count, timed_count, total_duration)
+SELECT character_id, dungeon_id, period_start, COUNT(*), COUNT(duration), COALESCE(SUM(duration), 0)
+FROM dungeons_entries_periods
+WHERE period_start IS NOT NULL
+GROUP BY character_id, dungeon_id, period_start;
+
+-- Runs are added to the stats once they are finished and taken out before they
+-- are deleted or changed, so that any write to dungeons_entries keeps them exact.
+CREATE TRIGGER IF NOT EXISTS dungeons_entries_stats_insert
+AFTER INSERT ON dungeons_entries
+WHEN NEW.finished_at IS NOT NULL
+BEGIN
+    INSERT INTO dungeons_entries_stats
+        (character_id, dungeon_id, period_start, completed_count, timed_count, total_duration)
+    SELECT character_id, dungeon_id, period_start, 1, duration IS NOT NULL, COALESCE(duration, 0)
+    FROM dungeons_entries_periods
+    WHERE id = NEW.id AND period_start IS NOT NULL
+    ON CONFLICT (character_id, dungeon_id, period_start) DO UPDATE SET
+        completed_count = completed_count + excluded.completed_count,
+        timed_count = timed_count + excluded.timed_count,
+        total_duration = total_duration + excluded.total_duration;
+END;
+
+CREATE TRIGGER IF NOT EXISTS dungeons_entries_stats_delete
+BEFORE DELETE ON dungeons_entries
+WHEN OLD.finished_at IS NOT NULL
+BEGIN
+    INSERT INTO dungeons_entries_stats
+        (character_id, dungeon_id, period_start, completed_count, timed_count, total_duration)
+    SELECT character_id, dungeon_id, period_start, -1, -(duration IS NOT NULL), -COALESCE(duration, 0)
+    FROM dungeons_entries_periods
+    WHERE id = OLD.id AND period_start IS NOT NULL
+    ON CONFLICT (character_id, dungeon_id, period_start) DO UPDATE SET
+        completed_count = completed_count + excluded.completed_count,
+        timed_count = timed_count + excluded.timed_count,
+        total_duration = total_duration + excluded.total_duration;
+END;
+
+CREATE TRIGGER IF NOT EXISTS dungeons_entries_stats_update_old
+BEFORE UPDATE OF character_id, dungeon_id, started_at, finished_at ON dungeons_entries
+WHEN OLD.finished_at IS NOT NULL
+BEGIN
+    INSERT INTO dungeons_entries_stats
+        (character_id, dungeon_id, period_start, completed_count, timed_count, total_duration)
+    SELECT character_id, dungeon_id, period_start, -1, -(duration IS NOT NULL), -COALESCE(duration, 0)
+    FROM dungeons_entries_periods
+    WHERE id = OLD.id AND period_start IS NOT NULL
+    ON CONFLICT (character_id, dungeon_id, period_start) DO UPDATE SET
+        completed_count = completed_count + excluded.completed_count,
+        timed_count = timed_count + excluded.timed_count,
+        total_duration = total_duration + excluded.total_duration;
+END;
+
+CREATE TRIGGER IF NOT EXISTS dungeons_entries_stats_update_new
+AFTER UPDATE OF character_id, dungeon_id, started_at, finished_at ON dungeons_entries
+WHEN NEW.finished_at IS NOT NULL
+BEGIN
+    INSERT INTO dungeons_entries_stats
+        (character_id, dungeon_id, period_start, completed_count, timed_count, total_duration)
+    SELECT character_id, dungeon_id, period_start, 1, duration IS NOT NULL, COALESCE(duration, 0)
+    FROM dungeons_entries_periods
+    WHERE id = NEW.id AND period_start IS NOT NULL
+    ON CONFLICT (character_id, dungeon_id, period_start) DO UPDATE SET
+        completed_count = completed_count + excluded.completed_count,
+        timed_count = timed_count + excluded.timed_count,
+        total_duration = total_duration + excluded.total_duration;
+END;
+
+-- Period counts and average clear times are read from the table above now, so
+-- nothing looks finished runs up by this index anymore; it only slowed writes
+DROP INDEX IF EXISTS idx_dungeons_entries_finished;
@@ -0,0 +1,293 @@
+import os
+import glob
+import shlex
+import ctypes
+import ctypes.util
+import threading
+import cv2
+import numpy as np
+import pytesseract
+
+from metrics import METRICS
+
+try:
+    import tesserocr
+except ImportError:
+    tesserocr = None
+
+
+class PytesseractEngine:
+    """
+    Runs the tesseract executable for every call: the image is written to a
+    temporary file and the language model is loaded again each time.
+    """
+
+    name = "pytesseract"
+
+    def __init__(self, tesseract_path=None):
+        if tesseract_path:
+            pytesseract.pytesseract.tesseract_cmd = tesseract_path
+
+    def image_to_string(self, image, config=""):
+        return pytesseract.image_to_string(image, config=config)
+
+    def close(self):
+        pass
+
+
+def parse_config(config):
+    """
+    Splits a tesseract command line config ("--oem 3 --psm 6 -c name=value")
+    into (oem, psm, variables).
+    """
+    oem = 3
+    psm = 3
+    variables = {}
+    tokens = shlex.split(config)
+    for (option, value) in zip(tokens, tokens[1:]):
+        if option == "--oem":
+            oem = int(value)
+        elif option == "--psm":
+            psm = int(value)
+        elif option == "-c":
+            (name, _, setting) = value.partition("=")
+            variables[name] = setting
+    return (oem, psm, variables)
+
+
+def raw_pixels(image):
+    """
+    Returns (bytes, width, height, channels) of an OpenCV image, as Tesseract
+    takes it: grayscale or RGB rows.
+    """
+    image = np.ascontiguousarray(image)
+    if image.ndim == 3 and image.shape[2] == 3:
+        # OpenCV images are BGR, Tesseract expects RGB
+        image = np.ascontiguousarray(image[:, :, ::-1])
+    height, width = image.shape[:2]
+    channels = 1 if image.ndim == 2 else image.shape[2]
+    return (image.tobytes(), width, height, channels)
+
+
+class TesserocrEngine:
+    """
+    Calls Tesseract's C API in-process through tesserocr. Every distinct config
+    gets its own API instance, created on first use and kept for the lifetime
+    of the process, so the model is loaded once and images are handed over
+    as raw pixels.
+    """
+
+    name = "tesserocr"
+
+    def __init__(self, tessdata=None, lang="eng"):
+        self.tessdata = tessdata
+        self.lang = lang
+        self.lock = threading.Lock()
+        self.apis = {}
+        # Fail now rather than on the first OCR call if the model can't be loaded
+        self.api("")
+
+    def api(self, config):
+        api = self.apis.get(config)
+        if api is None:
+            (oem, psm, variables) = parse_config(config)
+            kwargs = {"lang": self.lang, "oem": oem, "psm": psm}
+            if self.tessdata:
+                kwargs["path"] = self.tessdata
+            api = tesserocr.PyTessBaseAPI(**kwargs)
+            for (name, value) in variables.items():
+                api.SetVariable(name, value)
+            self.apis[config] = api
+        return api
+
+    def image_to_string(self, image, config=""):
+        (data, width, height, channels) = raw_pixels(image)
+        with self.lock:
+            api = self.api(config)
+            api.SetImageBytes(data, width, height, channels, width * channels)
+            return api.GetUTF8Text()
+
+    def close(self):
+        with self.lock:
+            for api in self.apis.values():
+                api.End()
+            self.apis.clear()
+
+
+class LibtesseractEngine:
+    """
+    Calls Tesseract's C API in-process through ctypes, from the libtesseract
+    library that ships with the bundled Tesseract, so builds get a long-lived
+    engine without tesserocr. Like TesserocrEngine, every distinct config gets
+    its own API handle, created on first use and kept until close.
+    """
+
+    name = "libtesseract"
+
+    def __init__(self, library, tessdata=None, lang="eng"):
+        self.dll_directory = None
+        if hasattr(os, "add_dll_directory"):
+            # Its dependencies (Leptonica and friends) sit next to it
+            self.dll_directory = os.add_dll_directory(os.path.dirname(os.path.abspath(library)))
+        self.lib = load_libtesseract(library)
+        self.tessdata = tessdata
+        self.lang = lang
+        self.lock = threading.Lock()
+        self.apis = {}
+        # Fail now rather than on the first OCR call if the model can't be loaded
+        self.api("")
+
+    def api(self, config):
+        handle = self.apis.get(config)
+        if handle is None:
+            (oem, psm, variables) = parse_config(config)
+            handle = self.lib.TessBaseAPICreate()
+            tessdata = self.tessdata.encode() if self.tessdata else None
+            if self.lib.TessBaseAPIInit2(handle, tessdata, self.lang.encode(), oem) != 0:
+                self.lib.TessBaseAPIDelete(handle)
+                raise RuntimeError(f"could not load the {self.lang} model")
+            self.lib.TessBaseAPISetPageSegMode(handle, psm)
+            for (name, value) in variables.items():
+                self.lib.TessBaseAPISetVariable(handle, name.encode(), value.encode())
+            self.apis[config] = handle
+        return handle
+
+    def image_to_string(self, image, config=""):
+        (data, width, height, channels) = raw_pixels(image)
+        with self.lock:
+            handle = self.api(config)
+            self.lib.TessBaseAPISetImage(handle, data, width, height, channels, width * channels)
+            text = self.lib.TessBaseAPIGetUTF8Text(handle)
+        if not text:
+            return ""
+        try:
+            return ctypes.string_at(text).decode("utf-8", errors="replace")
+        finally:
+            self.lib.TessDeleteText(text)
+
+    def close(self):
+        with self.lock:
+            for handle in self.apis.values():
+                self.lib.TessBaseAPIEnd(handle)
+                self.lib.TessBaseAPIDelete(handle)
+            self.apis.clear()
+
+
+def load_libtesseract(library):
+    lib = ctypes.CDLL(library)
+    handle = ctypes.c_void_p
+    lib.TessBaseAPICreate.restype = handle
+    lib.TessBaseAPICreate.argtypes = []
+    lib.TessBaseAPIInit2.restype = ctypes.c_int
+    lib.TessBaseAPIInit2.argtypes = [handle, ctypes.c_char_p, ctypes.c_char_p, ctypes.c_int]
+    lib.TessBaseAPISetPageSegMode.restype = None
+    lib.TessBaseAPISetPageSegMode.argtypes = [handle, ctypes.c_int]
+    lib.TessBaseAPISetVariable.restype = ctypes.c_int
+    lib.TessBaseAPISetVariable.argtypes = [handle, ctypes.c_char_p, ctypes.c_char_p]
+    lib.TessBaseAPISetImage.restype = None
+    lib.TessBaseAPISetImage.argtypes = [
+        handle, ctypes.c_char_p, ctypes.c_int, ctypes.c_int, ctypes.c_int, ctypes.c_int]
+    # A char * the caller frees with TessDeleteText, so not c_char_p
+    lib.TessBaseAPIGetUTF8Text.restype = ctypes.c_void_p
+    lib.TessBaseAPIGetUTF8Text.argtypes = [handle]
+    lib.TessDeleteText.restype = None
+    lib.TessDeleteText.argtypes = [ctypes.c_void_p]
+    lib.TessBaseAPIEnd.restype = None
+    lib.TessBaseAPIEnd.argtypes = [handle]
+    lib.TessBaseAPIDelete.restype = None
+    lib.TessBaseAPIDelete.argtypes = [handle]
+    return lib
+
+
+class TextGate:
+    """
+    A cheap check, run on an OCR site's mask before anything else, that it
+    holds something shaped like text: enough lit pixels, a plausible number
+    of blobs (connected components of at least min_blob_area pixels), and
+    blobs that together span a box at least min_aspect times wider than tall.
+    Whatever fails it can't be read as text, so OCR is skipped.
+
+    Passed and skipped checks are counted in the metrics as
+    ocr_gate.<name>.passed and ocr_gate.<name>.skipped.
+    """
+
+    def __init__(self, name, min_pixels, min_blobs=1, max_blobs=64, min_aspect=0.0, min_blob_area=4):
+        self.name = name
+        self.min_pixels = min_pixels
+        self.min_blobs = min_blobs
+        self.max_blobs = max_blobs
+        self.min_aspect = min_aspect
+        self.min_blob_area = min_blob_area
+
+    def looks_like_text(self, mask):
+        if cv2.countNonZero(mask) < self.min_pixels:
+            return False
+
+        _, _, stats, _ = cv2.connectedComponentsWithStats(mask, connectivity=8)
+        # Row 0 is the background
+        blobs = stats[1:][stats[1:, cv2.CC_STAT_AREA] >= self.min_blob_area]
+        if not self.min_blobs <= len(blobs) <= self.max_blobs:
+            return False
+
+        left = blobs[:, cv2.CC_STAT_LEFT].min()
+        top = blobs[:, cv2.CC_STAT_TOP].min()
+        right = (blobs[:, cv2.CC_STAT_LEFT] + blobs[:, cv2.CC_STAT_WIDTH]).max()
+        bottom = (blobs[:, cv2.CC_STAT_TOP] + blobs[:, cv2.CC_STAT_HEIGHT]).max()
+        return right - left >= self.min_aspect * (bottom - top)
+
+    def passes(self, mask):
+        passed = self.looks_like_text(mask)
+        METRICS.increment(f"ocr_gate.{self.name}.{'passed' if passed else 'skipped'}")
+        return passed
+
+
+def find_tessdata(tesseract_path):
+    # The bundled Tesseract keeps its models next to the executable
+    if tesseract_path:
+        tessdata = os.path.join(os.path.dirname(tesseract_path), "tessdata")
+        if os.path.isdir(tessdata):
+            return tessdata
+    return None
+
+
+def find_libtesseract(tesseract_path):
+    # The bundled Tesseract ships its library (libtesseract-5.dll) next to the executable
+    if tesseract_path:
+        directory = os.path.dirname(os.path.abspath(tesseract_path))
+        libraries = sorted(glob.glob(os.path.join(directory, "libtesseract*.dll")))
+        if libraries:
+            return libraries[-1]
+    return ctypes.util.find_library("tesseract")
+
+
+def create_engine(kind="auto", tesseract_path=None):
+    """
+    Returns the OCR engine to use: tesserocr when it's installed, otherwise
+    libtesseract when the library can be found, each only if it can load its
+    model, and pytesseract when neither can or it was asked for explicitly.
+    """
+    if kind in ("auto", "tesserocr"):
+        if tesserocr is None:
+            if kind == "tesserocr":
+                print("[ocr]: tesserocr is not installed, trying libtesseract")
+        else:
+            try:
+                engine = TesserocrEngine(find_tessdata(tesseract_path))
+                print("[ocr]: Using tesserocr")
+                return engine
+            except Exception as e:
+                print(f"[ocr]: Could not start tesserocr ({e}), trying libtesseract")
+
+    if kind != "pytesseract":
+        library = find_libtesseract(tesseract_path)
+        if library is None:
+            print("[ocr]: libtesseract not found, falling back to pytesseract")
+        else:
+            try:
+                engine = LibtesseractEngine(library, find_tessdata(tesseract_path))
+                print(f"[ocr]: Using libtesseract ({library})")
+                return engine
+            except Exception as e:
+                print(f"[ocr]: Could not start libtesseract ({e}), falling back to pytesseract")
+
+    return PytesseractEngine(tesseract_path)
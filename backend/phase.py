@@ -0,0 +1,95 @@
+import time
+
+
+LOBBY = "lobby"
+LOADING = "loading"
+IN_DUNGEON = "in_dungeon"
+RESULT = "result"
+
+
+class GamePhase:
+    """
+    Where the game is (lobby -> loading -> in dungeon -> result -> lobby) and
+    the run in progress, so that each frame only runs the detectors that can
+    move it to the next phase:
+
+    - lobby: lobby character (and penalty), loading screen unless a playing
+      character is shown (the app was started mid-dungeon)
+    - loading: lobby character (run abandoned), loading screen (still loading)
+    - in dungeon: lobby character (run left), playing character (whose run it
+      is), result banner, boss bar for Void
+    - result: lobby character, loading screen (next run)
+
+    Anything else is out of place for the phase and isn't looked at, e.g. the
+    loading screen scan in a dungeon or the result banner in the lobby.
+    """
+
+    def __init__(self, recorder=None):
+        self.recorder = recorder
+        self.phase = LOBBY
+        self.entered_at = time.monotonic()
+        self.entry_id = None
+        self.dungeon_id = None
+
+    def transition(self, phase, reason):
+        now = time.monotonic()
+        print(f"[GamePhase]: {self.phase} -> {phase} after {now - self.entered_at:.1f}s ({reason})")
+        self.phase = phase
+        self.entered_at = now
+
+    def step(self, state):
+        """
+        Runs the current phase's detectors on a GameState's frame, moving to
+        the next phase when one of them fires.
+        """
+        if self.phase == LOBBY:
+            state.match_lobby_character()
+            self.match_start(state)
+        elif self.phase == LOADING:
+            if state.match_lobby_character():
+                self.leave(state)
+            elif state.match_loading_screen() is None:
+                self.transition(IN_DUNGEON, "loading screen gone")
+        elif self.phase == IN_DUNGEON:
+            if state.match_lobby_character():
+                self.leave(state)
+                return
+
+            state.match_playing_character()
+            is_completed = state.match_result_banner()
+            state.match_void_floor(self.entry_id, self.dungeon_id)
+            if is_completed:
+                state.complete_dungeon_entry(self.entry_id, self.dungeon_id)
+                self.end_run("completed_dungeon")
+                self.transition(RESULT, "result banner")
+        elif self.phase == RESULT:
+            if state.match_lobby_character():
+                self.transition(LOBBY, "lobby character")
+            else:
+                self.match_start(state)
+
+    def match_start(self, state):
+        # Gameplay frames never show a loading screen, so don't scan them for one
+        if state.match_playing_character() is not None:
+            return
+
+        dungeon_id = state.match_loading_screen()
+        if dungeon_id is None:
+            return
+
+        self.entry_id = state.start_dungeon_entry(dungeon_id, state.character_id, state.has_penalty)
+        self.dungeon_id = dungeon_id
+        if self.recorder is not None:
+            self.recorder.dump("started_dungeon")
+        self.transition(LOADING, f"dungeon {dungeon_id}")
+
+    def leave(self, state):
+        completed = state.leave_dungeon(self.entry_id, self.dungeon_id)
+        self.end_run("completed_dungeon" if completed else "left_dungeon")
+        self.transition(LOBBY, "lobby character")
+
+    def end_run(self, reason):
+        if self.recorder is not None and self.entry_id is not None:
+            self.recorder.dump(reason)
+        self.entry_id = None
+        self.dungeon_id = None
@@ -0,0 +1,56 @@
+import cv2
+import numpy as np
+
+from metrics import METRICS
+
+
+class RoiCache:
+    """
+    Remembers, for every named ROI, a downsampled signature of its pixels and
+    the result that was recognized from them. As long as the ROI looks the same
+    on later frames, the previous result is reused instead of running template
+    matching or OCR again.
+
+    A signature is the ROI averaged over cell x cell blocks; the ROI counts as
+    changed once any block moves by more than threshold grey levels since the
+    result was computed.
+
+    Lookups are counted per ROI in the metrics as roi_cache.<name>.hits and
+    roi_cache.<name>.misses.
+    """
+
+    def __init__(self, cell=8, threshold=6):
+        self.cell = cell
+        self.threshold = threshold
+        self.entries = {}
+
+    def signature(self, roi):
+        c = self.cell
+        h, w = roi.shape[:2]
+        if h < c or w < c:
+            return roi.astype(np.int16)
+        blocks = roi[:h // c * c, :w // c * c]
+        return cv2.resize(
+            blocks, (w // c, h // c), interpolation=cv2.INTER_AREA).astype(np.int16)
+
+    def changed(self, previous, current):
+        return (
+            previous.shape != current.shape or
+            np.abs(current - previous).max() > self.threshold
+        )
+
+    def recall(self, name, roi, compute):
+        """
+        Returns compute(roi), or its last value if the named ROI hasn't changed
+        since it was computed.
+        """
+        signature = self.signature(roi)
+        entry = self.entries.get(name)
+        if entry is not None and not self.changed(entry[0], signature):
+            METRICS.increment(f"roi_cache.{name}.hits")
+            return entry[1]
+
+        METRICS.increment(f"roi_cache.{name}.misses")
+        result = compute(roi)
+        self.entries[name] = (signature, result)
+        return result
@@ -0,0 +1,164 @@
+import json
+import datetime
+import threading
+
+import database
+
+
+DAYS = ["Sunday", "Monday", "Tuesday", "Wednesday", "Thursday", "Friday", "Saturday"]
+
+
+def get_logic_date():
+    # Days (and so every entry period) roll over at 06:00 UTC
+    return (datetime.datetime.now(datetime.timezone.utc) - datetime.timedelta(hours=6)).date()
+
+
+class ScheduleState:
+    """
+    Tracked characters, their schedules, the dungeons' entry limits and the
+    current period's run counts, kept in memory to answer recommendations
+    without touching the database.
+
+    Everything is loaded on first use and again whenever the logic day changes,
+    since that's when entry periods reset. In between, writers keep it current:
+    refresh_count after a run is completed or edited, and reload after the
+    tracked characters or their schedules change.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.logic_date = None
+        self.tracked = []
+        self.names = {}
+        self.schedules = {}
+        self.limits = {}
+        self.counts = {}
+        # Bumped by every refresh_count; pair -> (generation, count) of the latest refresh
+        self.generation = 0
+        self.refreshed = {}
+
+    def reload(self, cursor):
+        with self.lock:
+            started = self.generation
+
+        tracked = cursor.execute(
+            "SELECT id, name FROM characters WHERE tracking = 1 ORDER BY id").fetchall()
+
+        schedules = {}
+        rows = cursor.execute("SELECT character_id, day, dungeon_id FROM character_schedules").fetchall()
+        for (char_id, day, dungeon_id) in rows:
+            schedules.setdefault(char_id, {}).setdefault(day, []).append(dungeon_id)
+
+        # A dungeon without a limit is done after a single run
+        limits = {
+            dungeon_id: entry_limit if entry_limit and entry_limit > 0 else 1
+            for (dungeon_id, entry_limit) in cursor.execute("SELECT id, entry_limit FROM dungeons")
+        }
+
+        counts = {
+            pair: count
+            for (pair, (count, _)) in database.get_period_stats(cursor).items()
+        }
+
+        with self.lock:
+            # A count refreshed while this was reading can be newer than the one read
+            for (pair, (generation, count)) in self.refreshed.items():
+                if generation > started:
+                    counts[pair] = count
+
+            self.logic_date = get_logic_date()
+            self.tracked = [char_id for (char_id, _) in tracked]
+            self.names = dict(tracked)
+            self.schedules = schedules
+            self.limits = limits
+            self.counts = counts
+
+    def refresh_count(self, cursor, character_id, dungeon_id):
+        if character_id is None or dungeon_id is None:
+            return
+
+        row = cursor.execute(
+            "SELECT entry_period, reset_day FROM dungeons WHERE id = ?", (dungeon_id,)).fetchone()
+        if not row:
+            return
+
+        count, _ = database.get_dungeon_stats(cursor, dungeon_id, character_id, *row)
+        pair = (int(character_id), int(dungeon_id))
+        with self.lock:
+            self.generation += 1
+            self.refreshed[pair] = (self.generation, count)
+            self.counts[pair] = count
+
+    def ensure_current(self, cursor):
+        if self.logic_date != get_logic_date():
+            self.reload(cursor)
+
+    def is_completed(self, character_id, dungeon_id):
+        return self.counts.get((character_id, dungeon_id), 0) >= self.limits[dungeon_id]
+
+    def scheduled_today(self, character_id):
+        day = DAYS[(self.logic_date.weekday() + 1) % 7]
+        return [
+            dungeon_id
+            for dungeon_id in self.schedules.get(character_id, {}).get(day, [])
+            if dungeon_id in self.limits
+        ]
+
+    def find_candidate(self, character_id, start_index, check_dungeon_id=None):
+        # Iterate through characters cyclically, strictly excluding the current one
+        for i in range(len(self.tracked)):
+            curr_char_id = self.tracked[(start_index + i) % len(self.tracked)]
+            if curr_char_id == character_id:
+                continue
+
+            target_dungeons = self.scheduled_today(curr_char_id)
+            if check_dungeon_id is not None:
+                if check_dungeon_id not in target_dungeons:
+                    continue
+                target_dungeons = [check_dungeon_id]
+
+            for d_id in target_dungeons:
+                if not self.is_completed(curr_char_id, d_id):
+                    return {"id": curr_char_id, "name": self.names[curr_char_id]}
+        return None
+
+    def all_tasks_done(self):
+        return all(
+            self.is_completed(char_id, d_id)
+            for char_id in self.tracked
+            for d_id in self.scheduled_today(char_id)
+        )
+
+    def get_recommendation(self, cursor, character_id, dungeon_id):
+        try:
+            self.ensure_current(cursor)
+            character_id = int(character_id) if character_id is not None else None
+            dungeon_id = int(dungeon_id) if dungeon_id is not None else None
+
+            with self.lock:
+                if not self.tracked:
+                    return json.dumps({"data": None})
+
+                start_index = 0
+                if character_id in self.tracked:
+                    start_index = (self.tracked.index(character_id) + 1) % len(self.tracked)
+
+                # Try to find someone for the specific dungeon first, then anyone
+                recommendation = None
+                if dungeon_id is not None:
+                    recommendation = self.find_candidate(character_id, start_index, dungeon_id)
+                if recommendation is None:
+                    recommendation = self.find_candidate(character_id, start_index)
+
+                return json.dumps({
+                    "data": {
+                        "recommendation": recommendation,
+                        "isAllDone": recommendation is None and self.all_tasks_done()
+                    }
+                })
+        except Exception as e:
+            print(f"Error in get_recommendation: {e}")
+            return json.dumps({"data": {"recommendation": None, "isAllDone": False}})
+
+
+SCHEDULE = ScheduleState()
@@ -1,27 +1,16 @@
 import cv2
 import game
-import os
 import sqlite3
-from utils import parse_args
 
 def main():
-    args = parse_args()
-    
     print("Looking for GrandChase window...")
     window = game.get_window()
     if window is None:
         print("Game window not found!")
         return
 
-    # Create user_data directory if it doesn't exist for the screenshot
-    if not os.path.exists(args.user_data):
-        os.makedirs(args.user_data)
-        
-    screenshot_path = os.path.join(args.user_data, "select_roi_temp.png")
-    print(f"Capturing screenshot to {screenshot_path}...")
-    
-    # take_screenshot takes (window, path)
-    img = game.take_screenshot(window, screenshot_path)
+    print("Capturing screenshot...")
+    img = game.take_screenshot(window)
     
     if img is None:
         print("Failed to capture screenshot!")
@@ -45,8 +34,6 @@ def main():
         print("\nSelection cancelled.")
 
     cv2.destroyAllWindows()
-    if os.path.exists(screenshot_path):
-        os.remove(screenshot_path)
 
 if __name__ == "__main__":
     main()
@@ -1,8 +1,7 @@
 import http.server
 import json
-import sqlite3
+import time
 import urllib.parse
-from utils import parse_args
 from database import (
     get_dungeons,
     get_dungeons_entries,
@@ -11,253 +10,314 @@ from database import (
     update_tracked_characters,
     update_dungeon_entries,
     get_statistics,
-    get_recommendation,
-    get_recommendation,
     get_inventory,
     update_inventory_item,
     get_items,
     grant_inventory_item
 )
+from schedule import SCHEDULE
+from sse import KEEP_ALIVE
+from metrics import METRICS
+
+
+# Seconds between keep-alive comments on idle event streams, and the longest a
+# write to an event stream may block before the client is dropped
+SSE_KEEP_ALIVE_INTERVAL = 15
+SSE_WRITE_TIMEOUT = 10
+
+CORS_HEADERS = {
+    "Access-Control-Allow-Origin": "*",
+    "Access-Control-Allow-Methods": "GET, POST, OPTIONS",
+    "Access-Control-Allow-Headers": "Content-Type",
+}
+
+# (method, path) -> (handler, timed), filled in by @route
+ROUTES = {}
+
+
+def route(method, path, timed=True):
+    """
+    Registers a Handler method for an exact path. It's called with the query
+    string parsed into a dict of first values. Untimed routes (event streams)
+    are left out of the latency metrics.
+    """
+    def register(func):
+        ROUTES[(method, path)] = (func, timed)
+        return func
+    return register
+
+
+class BadRequest(Exception):
+    pass
 
 
 class Handler(http.server.SimpleHTTPRequestHandler):
-    def __init__(self, *args, broadcaster=None, **kwargs):
+    def __init__(self, *args, broadcaster=None, pool=None, recorder=None, cache=None, **kwargs):
         self.broadcaster = broadcaster
+        self.pool = pool
+        self.recorder = recorder
+        self.cache = cache
+        self.status = None
         super().__init__(*args, **kwargs)
 
     def end_headers(self):
-        self.send_header("Access-Control-Allow-Origin", "*")
-        self.send_header("Access-Control-Allow-Methods", "GET, POST, OPTIONS")
-        self.send_header("Access-Control-Allow-Headers", "Content-Type")
+        for (name, value) in CORS_HEADERS.items():
+            self.send_header(name, value)
         super().end_headers()
 
+    def send_response(self, code, message=None):
+        self.status = code
+        super().send_response(code, message)
+
     def do_OPTIONS(self):
         self.send_response(204)
         self.end_headers()
 
-    def do_POST(self):
-        if self.path == "/tracked_characters":
-            self.send_response(200)
-            self.send_header("Content-type", "application/json")
-            self.end_headers()
-
-            args = parse_args()
-            with sqlite3.connect(f"{args.user_data}/oh-my-gc.sqlite3") as DB:
-                content_len = int(self.headers.get("Content-Length"))
-            body = self.rfile.read(content_len).decode("utf-8")
-            payload = json.loads(body)
-            response = update_tracked_characters(DB, payload)
-            self.wfile.write(response.encode())
-
-        elif self.path == "/dungeons_entries":
-            try:
-                self.send_response(200)
-                self.send_header("Content-type", "application/json")
-                self.end_headers()
+    def do_GET(self):
+        self.dispatch("GET")
 
-                args = parse_args()
-                with sqlite3.connect(f"{args.user_data}/oh-my-gc.sqlite3") as DB:
-                    content_len = int(self.headers.get("Content-Length"))
-                    body = json.loads(self.rfile.read(
-                        content_len).decode("utf-8"))
-                    dungeon_id = body["dungeonId"]
-                    character_id = body["characterId"]
-                    value = body["value"]
-
-                    response = update_dungeon_entries(
-                        DB, dungeon_id, character_id, value)
-                    if response is None:
-                        self.send_error(500, "Server Error")
-                    else:
-                        self.wfile.write(response.encode())
-            except Exception as e:
-                self.send_error(500, f"Server Error: {e}")
-
-        elif self.path == "/inventory":
-            try:
-                self.send_response(200)
-                self.send_header("Content-type", "application/json")
-                self.end_headers()
+    def do_POST(self):
+        self.dispatch("POST")
 
-                args = parse_args()
-                with sqlite3.connect(f"{args.user_data}/oh-my-gc.sqlite3") as DB:
-                    content_len = int(self.headers.get("Content-Length"))
-                    payload = json.loads(self.rfile.read(content_len).decode("utf-8"))
-                    response = update_inventory_item(DB, payload)
-                    if response is None:
-                        self.send_error(500, "Server Error")
-                    else:
-                        self.wfile.write(response.encode())
-            except Exception as e:
-                self.send_error(500, f"Server Error: {e}")
-
-        elif self.path == "/inventory/add":
-            try:
-                self.send_response(200)
-                self.send_header("Content-type", "application/json")
+    def dispatch(self, method):
+        self.status = None
+        url = urllib.parse.urlsplit(self.path)
+        entry = ROUTES.get((method, url.path))
+        if entry is None:
+            self.send_error(404, "Not Found")
+            return
+
+        (handler, timed) = entry
+        params = {key: values[0] for (key, values) in urllib.parse.parse_qs(url.query).items()}
+        started = time.perf_counter()
+        try:
+            handler(self, params)
+        except BadRequest as e:
+            self.send_failure(400, f"Bad Request: {e}")
+        except Exception as e:
+            print(f"[server]: {method} {url.path} failed: {e}")
+            self.send_failure(500, f"Server Error: {e}")
+        finally:
+            if timed:
+                elapsed_ms = (time.perf_counter() - started) * 1000
+                METRICS.observe(f"{method} {url.path}", elapsed_ms, failed=(self.status or 500) >= 400)
+
+    def send_failure(self, code, message):
+        if self.status is None:
+            self.send_error(code, message)
+        else:
+            # The response already started; all that's left is to drop it
+            self.close_connection = True
+
+    def read_json(self):
+        try:
+            content_len = int(self.headers.get("Content-Length") or 0)
+            return json.loads(self.rfile.read(content_len).decode("utf-8"))
+        except ValueError as e:
+            raise BadRequest(e)
+
+    def send_json(self, compute):
+        """
+        Responds with the JSON returned by compute(DB). Clients that already
+        have the current version get a 304; otherwise the cached body is reused
+        while the data hasn't changed, gzipped when the client accepts it.
+        """
+        if self.cache is None:
+            with self.pool.connection() as DB:
+                response = compute(DB)
+            self.send_result(response)
+            return
+
+        version = self.cache.version()
+        accept_encoding = self.headers.get("Accept-Encoding", "")
+        if_none_match = self.headers.get("If-None-Match", "")
+        for encoding in ("gzip", None):
+            etag = self.cache.etag(version, encoding)
+            if etag in if_none_match:
+                self.send_response(304)
+                self.send_header("ETag", etag)
                 self.end_headers()
-
-                args = parse_args()
-                with sqlite3.connect(f"{args.user_data}/oh-my-gc.sqlite3") as DB:
-                    content_len = int(self.headers.get("Content-Length"))
-                    payload = json.loads(self.rfile.read(content_len).decode("utf-8"))
-                    
-                    character_id = payload.get("characterId")
-                    item_id = payload.get("itemId")
-                    quantity = payload.get("quantity", 1)
-                    
-                    success = grant_inventory_item(DB, character_id, item_id, quantity)
-                    if not success:
-                        self.send_error(500, "Server Error")
-                    else:
-                        self.wfile.write(json.dumps({"data": "ok"}).encode())
-            except Exception as e:
-                self.send_error(500, f"Server Error: {e}")
-
+                return
+
+        entry = self.cache.get(self.path, version)
+        if entry is None:
+            with self.pool.connection() as DB:
+                response = compute(DB)
+            if response is None:
+                self.send_error(500, "Server Error")
+                return
+            entry = self.cache.put(self.path, version, response.encode())
+
+        (body, encoding) = self.cache.encode(entry, accept_encoding)
+        self.send_body(body, self.cache.etag(version, encoding), encoding)
+
+    def send_result(self, response):
+        # Database functions return None when they fail
+        if response is None:
+            self.send_error(500, "Server Error")
         else:
-            self.send_error(404, "Not Found")
-
-    def do_GET(self):
-        if self.path == "/events":
-            self.send_response(200)
-            self.send_header("Content-type", "text/event-stream")
+            self.send_body(response.encode())
+
+    def send_body(self, body, etag=None, encoding=None):
+        self.send_response(200)
+        self.send_header("Content-type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        if etag is not None:
+            self.send_header("ETag", etag)
             self.send_header("Cache-Control", "no-cache")
-            self.send_header("Connection", "keep-alive")
-            self.end_headers()
-
-            q = self.broadcaster.register()
-            try:
-                while True:
-                    message = q.get()
-                    self.wfile.write(message.encode("utf-8"))
-                    self.wfile.flush()
-            except BrokenPipeError:
-                print("[server]: Client disconnected")
-            finally:
-                self.broadcaster.unregister(q)
-
-        elif self.path == "/dungeons":
-            self.send_response(200)
-            self.send_header("Content-type", "application/json")
-            self.end_headers()
-
-            args = parse_args()
-            with sqlite3.connect(f"{args.user_data}/oh-my-gc.sqlite3") as DB:
-                response = get_dungeons(DB)
-                if response is None:
-                    self.send_error(500, "Server Error")
-                else:
-                    self.wfile.write(response.encode())
-
-        elif self.path == "/characters":
-            self.send_response(200)
-            self.send_header("Content-type", "application/json")
-            self.end_headers()
-
-            args = parse_args()
-            with sqlite3.connect(f"{args.user_data}/oh-my-gc.sqlite3") as DB:
-                response = get_characters(DB)
-                if response is None:
-                    self.send_error(500, "Server Error")
-                else:
-                    self.wfile.write(response.encode())
-
-        elif self.path.startswith("/dungeons_entries"):
-            self.send_response(200)
-            self.send_header("Content-type", "application/json")
-            self.end_headers()
-
-            query = urllib.parse.urlparse(self.path).query
-            params = urllib.parse.parse_qs(query)
-            character_id = params.get("character_id", [None])[0]
-
-            args = parse_args()
-            with sqlite3.connect(f"{args.user_data}/oh-my-gc.sqlite3") as DB:
-                response = get_dungeons_entries(DB, character_id)
-                if response is None:
-                    self.send_error(500, "Server Error")
-                else:
-                    self.wfile.write(response.encode())
-
-        elif self.path == "/statistics":
-            self.send_response(200)
-            self.send_header("Content-type", "application/json")
-            self.end_headers()
-
-            args = parse_args()
-            with sqlite3.connect(f"{args.user_data}/oh-my-gc.sqlite3") as DB:
-                response = get_statistics(DB)
-                if response is None:
-                    self.send_error(500, "Server Error")
-                else:
-                    self.wfile.write(response.encode())
-
-        elif self.path == "/tracked_characters":
-            self.send_response(200)
-            self.send_header("Content-type", "application/json")
-            self.end_headers()
-
-            args = parse_args()
-            with sqlite3.connect(f"{args.user_data}/oh-my-gc.sqlite3") as DB:
-                response = get_tracked_characters(DB)
-                if response is None:
-                    self.send_error(500, "Server Error")
-                else:
-                    self.wfile.write(response.encode())
-
-        elif self.path.startswith("/recommend"):
-            self.send_response(200)
-            self.send_header("Content-type", "application/json")
-            self.end_headers()
-
-            query = urllib.parse.urlparse(self.path).query
-            params = urllib.parse.parse_qs(query)
-            character_id = params.get("character_id", [None])[0]
-            dungeon_id = params.get("dungeon_id", [None])[0]
-
-            args = parse_args()
-            with sqlite3.connect(f"{args.user_data}/oh-my-gc.sqlite3") as DB:
-                actual_dungeon_id = None
-                if dungeon_id:
-                    try:
-                        actual_dungeon_id = int(dungeon_id)
-                    except ValueError:
-                        cursor = DB.cursor()
-                        row = cursor.execute("SELECT id FROM dungeons WHERE name = ?", (dungeon_id,)).fetchone()
-                        if row:
-                            actual_dungeon_id = row[0]
-
-                response = get_recommendation(DB, character_id, actual_dungeon_id)
-                if response is None:
-                    self.send_error(500, "Server Error")
-                else:
-                    self.wfile.write(response.encode())
-
-        elif self.path.startswith("/inventory"):
-            self.send_response(200)
-            self.send_header("Content-type", "application/json")
-            self.end_headers()
-
-            args = parse_args()
-            with sqlite3.connect(f"{args.user_data}/oh-my-gc.sqlite3") as DB:
-                response = get_inventory(DB)
-                if response is None:
-                    self.send_error(500, "Server Error")
-                else:
-                    self.wfile.write(response.encode())
-
-        elif self.path == "/items":
-            self.send_response(200)
-            self.send_header("Content-type", "application/json")
-            self.end_headers()
-
-            args = parse_args()
-            with sqlite3.connect(f"{args.user_data}/oh-my-gc.sqlite3") as DB:
-                response = get_items(DB)
-                if response is None:
-                    self.send_error(500, "Server Error")
-                else:
-                    self.wfile.write(response.encode())
+            self.send_header("Vary", "Accept-Encoding")
+        if encoding is not None:
+            self.send_header("Content-Encoding", encoding)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def send_events(self, listener, messages):
+        if not messages:
+            return
+
+        data = b"".join(messages)
+        started = time.perf_counter()
+        self.wfile.write(data)
+        self.wfile.flush()
+        listener.wrote(len(messages), len(data), time.perf_counter() - started)
+
+    @route("GET", "/events", timed=False)
+    def events(self, params):
+        self.send_response(200)
+        self.send_header("Content-type", "text/event-stream")
+        self.send_header("Cache-Control", "no-cache")
+        self.send_header("Connection", "keep-alive")
+        self.end_headers()
 
+        last_event_id = self.headers.get("Last-Event-ID")
+        try:
+            last_event_id = int(last_event_id) if last_event_id else None
+        except ValueError:
+            last_event_id = None
+
+        listener, backlog = self.broadcaster.register(last_event_id)
+        # A client that stops reading fails the write instead of holding this thread forever
+        self.connection.settimeout(SSE_WRITE_TIMEOUT)
+        try:
+            self.send_events(listener, backlog)
+            while True:
+                messages = self.broadcaster.read(listener, timeout=SSE_KEEP_ALIVE_INTERVAL)
+                if messages:
+                    self.send_events(listener, messages)
+                else:
+                    # Nothing to send for a while; a dead connection fails here
+                    self.wfile.write(KEEP_ALIVE)
+                    self.wfile.flush()
+                    listener.keep_alives += 1
+        except OSError as e:
+            # Covers resets and, on Python 3.9 where it isn't a TimeoutError, socket.timeout
+            print(f"[server]: Client disconnected ({type(e).__name__})")
+        finally:
+            self.broadcaster.unregister(listener)
+
+    @route("GET", "/events/stats")
+    def events_stats(self, params):
+        self.send_body(json.dumps({"data": self.broadcaster.stats()}).encode())
+
+    @route("GET", "/metrics")
+    def metrics(self, params):
+        self.send_body(json.dumps({"data": METRICS.snapshot()}).encode())
+
+    @route("GET", "/dungeons")
+    def dungeons(self, params):
+        self.send_json(get_dungeons)
+
+    @route("GET", "/characters")
+    def characters(self, params):
+        self.send_json(get_characters)
+
+    @route("GET", "/dungeons_entries")
+    def dungeons_entries(self, params):
+        character_id = params.get("character_id")
+        self.send_json(lambda DB: get_dungeons_entries(DB, character_id))
+
+    @route("GET", "/statistics")
+    def statistics(self, params):
+        self.send_json(get_statistics)
+
+    @route("GET", "/tracked_characters")
+    def tracked_characters(self, params):
+        self.send_json(get_tracked_characters)
+
+    @route("GET", "/recommend")
+    def recommend(self, params):
+        character_id = params.get("character_id")
+        dungeon_id = params.get("dungeon_id")
+
+        with self.pool.connection() as DB:
+            actual_dungeon_id = None
+            if dungeon_id:
+                try:
+                    actual_dungeon_id = int(dungeon_id)
+                except ValueError:
+                    cursor = DB.cursor()
+                    row = cursor.execute("SELECT id FROM dungeons WHERE name = ?", (dungeon_id,)).fetchone()
+                    if row:
+                        actual_dungeon_id = row[0]
+
+            response = SCHEDULE.get_recommendation(DB.cursor(), character_id, actual_dungeon_id)
+        self.send_result(response)
+
+    @route("GET", "/inventory")
+    def inventory(self, params):
+        self.send_json(get_inventory)
+
+    @route("GET", "/items")
+    def items(self, params):
+        self.send_json(get_items)
+
+    @route("POST", "/tracked_characters")
+    def post_tracked_characters(self, params):
+        payload = self.read_json()
+        with self.pool.connection() as DB:
+            response = update_tracked_characters(DB, payload)
+            SCHEDULE.reload(DB.cursor())
+        self.send_result(response)
+
+    @route("POST", "/dungeons_entries")
+    def post_dungeons_entries(self, params):
+        body = self.read_json()
+        try:
+            dungeon_id = body["dungeonId"]
+            character_id = body["characterId"]
+            value = body["value"]
+        except (KeyError, TypeError) as e:
+            raise BadRequest(f"missing {e}")
+
+        with self.pool.connection() as DB:
+            response = update_dungeon_entries(DB, dungeon_id, character_id, value)
+            if response is not None:
+                SCHEDULE.refresh_count(DB.cursor(), character_id, dungeon_id)
+        self.send_result(response)
+
+    @route("POST", "/inventory")
+    def post_inventory(self, params):
+        payload = self.read_json()
+        with self.pool.connection() as DB:
+            response = update_inventory_item(DB, payload)
+        self.send_result(response)
+
+    @route("POST", "/inventory/add")
+    def post_inventory_add(self, params):
+        payload = self.read_json()
+        with self.pool.connection() as DB:
+            success = grant_inventory_item(
+                DB, payload.get("characterId"), payload.get("itemId"), payload.get("quantity", 1))
+        if not success:
+            self.send_error(500, "Server Error")
         else:
-            self.send_error(404, "Not Found")
+            self.send_body(json.dumps({"data": "ok"}).encode())
+
+    @route("POST", "/debug/frames")
+    def post_debug_frames(self, params):
+        if self.recorder is None:
+            self.send_error(404, "Frame recording is disabled")
+            return
+
+        path = self.recorder.dump("request")
+        self.send_body(json.dumps({"data": path}).encode())
@@ -1,28 +1,165 @@
-import queue
+import time
 import threading
 import json
+from collections import deque
+
+
+# Events that only describe the current state: a listener that hasn't sent the
+# previous one yet only needs the latest, and new listeners start with it
+STATE_EVENTS = {"character", "window_status"}
+
+KEEP_ALIVE = b": keep-alive\n\n"
+
+
+class Listener:
+    """
+    One client's position in the broadcaster's log, plus counters describing
+    how well it keeps up.
+    """
+
+    def __init__(self, cursor):
+        self.cursor = cursor
+        self.connected_at = time.time()
+        self.sent = 0
+        self.coalesced = 0
+        self.resyncs = 0
+        self.keep_alives = 0
+        self.bytes = 0
+        self.max_write_ms = 0.0
+
+    def wrote(self, messages, size, elapsed):
+        self.sent += messages
+        self.bytes += size
+        self.max_write_ms = max(self.max_write_ms, elapsed * 1000)
+
+    def stats(self, last_id):
+        return {
+            "connectedFor": round(time.time() - self.connected_at, 1),
+            "lag": last_id - self.cursor,
+            "sent": self.sent,
+            "coalesced": self.coalesced,
+            "resyncs": self.resyncs,
+            "keepAlives": self.keep_alives,
+            "bytes": self.bytes,
+            "maxWriteMs": round(self.max_write_ms, 2),
+        }
 
 
 class SSEBroadcaster:
-    def __init__(self):
-        self.listeners = []
+    """
+    Keeps a log of the last events, each serialized and encoded once with an
+    increasing id; listeners are just cursors into it, so broadcasting costs
+    the same however many clients are connected. An event whose data is the
+    same as the last one of its name is dropped, so the stream only carries
+    changes.
+
+    A client reconnecting with the id it last saw (Last-Event-ID) resumes from
+    there. Ids start from the current time, so ids from before a restart are
+    never mistaken for new ones. A client whose position has already left the
+    log gets a "resync" event telling it to refetch everything, followed by the
+    current state, since unchanged state events aren't sent again.
+    """
+
+    def __init__(self, history=256):
+        self.listeners = set()
         self.lock = threading.Lock()
+        self.condition = threading.Condition(self.lock)
+        self.last_id = int(time.time() * 1000)
+        self.log = deque(maxlen=history)
+        self.latest = {}
+        self.watchers = []
 
-    def register(self):
-        q = queue.Queue(maxsize=5)
+    def watch(self, callback):
+        """
+        Calls callback (from the broadcasting thread) after every new event, for
+        listeners that wait on something other than this condition.
+        """
         with self.lock:
-            self.listeners.append(q)
-        return q
+            self.watchers.append(callback)
 
-    def unregister(self, q):
+    def register(self, last_event_id=None):
+        """
+        Returns the listener and the messages to send it first: the current
+        state for a new client, nothing for a reconnecting one (it resumes
+        from last_event_id on its first read).
+        """
         with self.lock:
-            self.listeners.remove(q)
+            if last_event_id is None:
+                listener = Listener(self.last_id)
+                backlog = self.state_messages()
+            else:
+                listener = Listener(last_event_id)
+                backlog = []
+            self.listeners.add(listener)
+        return listener, backlog
+
+    def state_messages(self, id=None):
+        """
+        Returns the latest message of each state event, oldest first, or with
+        each one's id replaced by id. Called with the lock held.
+        """
+        latest = sorted(
+            (last_id, event, payload, message) for (event, (payload, last_id, message)) in self.latest.items()
+            if event in STATE_EVENTS
+        )
+        if id is None:
+            return [message for (_, _, _, message) in latest]
+        return [self.format(id, event, payload) for (_, event, payload, _) in latest]
+
+    def unregister(self, listener):
+        with self.lock:
+            self.listeners.discard(listener)
+
+    def format(self, id, event, payload):
+        return f"id: {id}\nevent: {event}\ndata: {payload}\n\n".encode("utf-8")
 
     def broadcast(self, event, data):
-        message = f"event: {event}\ndata: {json.dumps(data)}\n\n"
+        payload = json.dumps(data)
+        with self.condition:
+            if event in self.latest and self.latest[event][0] == payload:
+                return
+
+            self.last_id += 1
+            message = self.format(self.last_id, event, payload)
+            self.latest[event] = (payload, self.last_id, message)
+            self.log.append((self.last_id, event, message))
+            self.condition.notify_all()
+            watchers = list(self.watchers)
+
+        for callback in watchers:
+            callback()
+
+    def read(self, listener, timeout=None):
+        """
+        Waits up to timeout for messages past the listener's cursor and returns
+        them, keeping only the latest of each state event. Returns an empty
+        list on timeout.
+        """
+        with self.condition:
+            if not self.condition.wait_for(lambda: self.last_id != listener.cursor, timeout):
+                return []
+
+            oldest = self.log[0][0] if self.log else self.last_id + 1
+            if not oldest - 1 <= listener.cursor <= self.last_id:
+                listener.cursor = self.last_id
+                listener.resyncs += 1
+                # Stamped with the current id, so the client resumes from here if it reconnects
+                return [self.format(self.last_id, "resync", "{}")] + self.state_messages(self.last_id)
+
+            pending = [entry for entry in self.log if entry[0] > listener.cursor]
+            listener.cursor = self.last_id
+
+        last_state = {event: id for (id, event, _) in pending if event in STATE_EVENTS}
+        messages = [
+            message for (id, event, message) in pending
+            if event not in STATE_EVENTS or last_state[event] == id
+        ]
+        listener.coalesced += len(pending) - len(messages)
+        return messages
+
+    def stats(self):
         with self.lock:
-            for q in self.listeners:
-                try:
-                    q.put_nowait(message)
-                except queue.Full:
-                    pass
+            return {
+                "lastId": self.last_id,
+                "listeners": [listener.stats(self.last_id) for listener in self.listeners],
+            }
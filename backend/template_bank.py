@@ -0,0 +1,286 @@
+import os
+import cv2
+import numpy as np
+
+
+def load_templates(path, gray=False):
+    templates = []
+    for filename in sorted(os.listdir(path)):
+        if not filename.endswith(".png"):
+            continue
+        name = filename.replace(".png", "")
+        flags = cv2.IMREAD_GRAYSCALE if gray else cv2.IMREAD_COLOR
+        templates.append((name, cv2.imread(os.path.join(path, filename), flags)))
+    return templates
+
+
+def normalize(img):
+    """
+    Flattens an image into a zero-mean, unit-length float32 vector, so that the
+    dot product of two of them is their TM_CCOEFF_NORMED score.
+    """
+    img = img.astype(np.float32)
+    channels = 1 if img.ndim == 2 else img.shape[2]
+    flat = img.reshape(-1, channels)
+    flat = (flat - flat.mean(axis=0)).ravel()
+    norm = np.linalg.norm(flat)
+    if norm == 0:
+        return flat
+    return flat / norm
+
+
+def project(img):
+    """
+    Returns img flattened to float32 with the norm of its zero-mean version.
+    Templates are already zero-mean, so dotting them with this vector and
+    dividing by the norm gives the same score as with normalize(img), without
+    building a mean-subtracted copy of the ROI.
+    """
+    _, std = cv2.meanStdDev(img)
+    norm = float(np.sqrt(np.sum(std ** 2) * img.shape[0] * img.shape[1]))
+    return img.reshape(-1).astype(np.float32), norm
+
+
+def pyramid_down(img, levels):
+    for _ in range(levels):
+        img = cv2.pyrDown(img)
+    return img
+
+
+def pyramid_size(size, levels):
+    w, h = size
+    for _ in range(levels):
+        w, h = (w + 1) // 2, (h + 1) // 2
+    return (w, h)
+
+
+def window_sums(img, h, w):
+    """
+    Sum of every h x w window of img, through a summed-area table.
+    """
+    table = img.cumsum(axis=0).cumsum(axis=1)
+    table = np.pad(table, ((1, 0), (1, 0)) + ((0, 0),) * (img.ndim - 2))
+    return table[h:, w:] - table[:-h, w:] - table[h:, :-w] + table[:-h, :-w]
+
+
+class FFTMatcher:
+    """
+    Slides same-sized templates over a larger search area and scores every
+    position with TM_CCOEFF_NORMED, computed in the frequency domain.
+
+    Each template's spectrum is computed once at load time; on every call the
+    search area is transformed once and that spectrum is reused for all of them.
+    """
+
+    def __init__(self, templates, search_size):
+        w, h = search_size
+        self.search_size = search_size
+        self.template_size = templates[0].shape[:2]
+        self.fft_shape = (cv2.getOptimalDFTSize(h), cv2.getOptimalDFTSize(w))
+
+        th, tw = self.template_size
+        spectra = []
+        for template in templates:
+            normalized = normalize(template).reshape(th, tw, -1)
+            # Correlation is a convolution with the flipped template
+            flipped = np.ascontiguousarray(normalized[::-1, ::-1].transpose(2, 0, 1))
+            spectra.append(np.fft.rfft2(flipped, s=self.fft_shape))
+        self.spectra = np.stack(spectra)
+
+    def correlate(self, area):
+        """
+        Returns an (n_templates, h - th + 1, w - tw + 1) map of scores.
+        """
+        th, tw = self.template_size
+        h, w = area.shape[:2]
+
+        area = area.astype(np.float32).reshape(h, w, -1)
+        spectrum = np.fft.rfft2(area.transpose(2, 0, 1), s=self.fft_shape)
+        # Cross-correlation summed over channels, for every template at once
+        products = (self.spectra * spectrum).sum(axis=1)
+        numerators = np.fft.irfft2(products, s=self.fft_shape)[:, th-1:h, tw-1:w]
+
+        area = area.astype(np.float64)
+        sums = window_sums(area, th, tw)
+        squares = window_sums(area * area, th, tw)
+        variance = (squares - sums * sums / (th * tw)).sum(axis=2)
+
+        norms = np.sqrt(np.maximum(variance, 0))
+        scores = np.zeros_like(numerators)
+        np.divide(numerators, norms, out=scores, where=norms > 1e-3)
+        return scores
+
+    def scores(self, area):
+        return self.correlate(area).max(axis=(1, 2))
+
+
+class TemplateBank:
+    """
+    Loads every template of a directory once and stacks them into a single
+    preprocessed matrix, so a ROI is scored against all of them in one pass.
+
+    Scores match cv2.matchTemplate(TM_CCOEFF_NORMED). Templates are captured at
+    the ROI size, but some are a few pixels larger: like OpenCV, those slide over
+    the ROI, so each of their ROI-sized windows gets its own row in the matrix.
+    Templates smaller than the ROI are searched across it by an FFTMatcher
+    instead, one per template size.
+
+    With levels > 0, templates and the expected ROI are taken that many levels
+    down an image pyramid, each level halving their size.
+    """
+
+    def __init__(self, path, roi_size, gray=False, levels=0):
+        w, h = pyramid_size(roi_size, levels)
+        self.roi_size = (w, h)
+        self.gray = gray
+        self.levels = levels
+        self.names = []
+        # Matrix rows of each template, or None when it slides across the ROI
+        self.rows = []
+        self.sliding = {}
+
+        rows = []
+        offsets = []
+        groups = {}
+        for (name, template) in load_templates(path, gray):
+            index = len(self.names)
+            self.names.append(name)
+
+            template = pyramid_down(template, levels)
+            th, tw = template.shape[:2]
+            if th >= h and tw >= w:
+                first = len(rows)
+                for y in range(th - h + 1):
+                    for x in range(tw - w + 1):
+                        rows.append(normalize(template[y:y+h, x:x+w]))
+                        offsets.append((y, x))
+                self.rows.append(np.arange(first, len(rows)))
+            elif th <= h and tw <= w:
+                self.rows.append(None)
+                self.sliding[index] = template
+                groups.setdefault((th, tw), []).append(index)
+            else:
+                raise ValueError(
+                    f"Template {name} ({tw}x{th}) does not fit the {w}x{h} ROI")
+
+        self.offsets = np.array(offsets, dtype=int).reshape(-1, 2)
+        self.matrix = np.ascontiguousarray(np.stack(rows)) if rows else None
+        self.matchers = [
+            (np.array(indices),
+             FFTMatcher([self.sliding[i] for i in indices], self.roi_size))
+            for indices in groups.values()
+        ]
+
+    def __len__(self):
+        return len(self.names)
+
+    def _check(self, roi):
+        h, w = roi.shape[:2]
+        if (w, h) != self.roi_size:
+            raise ValueError(f"Expected a {self.roi_size} ROI, got {(w, h)}")
+
+    def locate(self, roi):
+        """
+        Returns the best score of every template, and the (y, x) position of
+        that score in what would be its matchTemplate result.
+        """
+        self._check(roi)
+
+        scores = np.full(len(self.names), -1, dtype=np.float32)
+        positions = np.zeros((len(self.names), 2), dtype=int)
+        if self.matrix is not None:
+            row_scores = self._row_scores(roi)
+            for (index, rows) in enumerate(self.rows):
+                if rows is not None:
+                    best = rows[np.argmax(row_scores[rows])]
+                    scores[index] = row_scores[best]
+                    positions[index] = self.offsets[best]
+
+        for (indices, matcher) in self.matchers:
+            maps = matcher.correlate(roi).reshape(len(indices), -1)
+            best = maps.argmax(axis=1)
+            scores[indices] = maps[np.arange(len(indices)), best]
+            positions[indices] = np.column_stack(
+                np.unravel_index(best, (roi.shape[0] - matcher.template_size[0] + 1,
+                                        roi.shape[1] - matcher.template_size[1] + 1)))
+        return scores, positions
+
+    def _row_scores(self, roi):
+        flat, norm = project(roi)
+        if norm == 0:
+            return np.zeros(len(self.matrix), dtype=np.float32)
+        return (self.matrix @ flat) / norm
+
+    def scores(self, roi):
+        return self.locate(roi)[0]
+
+    def refine(self, roi, candidates, margin):
+        """
+        Scores only the given (index, (y, x)) candidates, at the positions within
+        margin pixels of (y, x) in their matchTemplate result.
+        """
+        self._check(roi)
+
+        flat, norm = project(roi)
+        scores = {}
+        for (index, (y, x)) in candidates:
+            rows = self.rows[index]
+            if rows is not None:
+                near = rows[np.abs(self.offsets[rows] - (y, x)).max(axis=1) <= margin]
+                scores[index] = 0.0 if norm == 0 else max(
+                    (float(self.matrix[row] @ flat) / norm for row in near), default=-1.0)
+                continue
+
+            template = self.sliding[index]
+            th, tw = template.shape[:2]
+            h, w = roi.shape[:2]
+            top, left = max(0, y - margin), max(0, x - margin)
+            bottom, right = min(h, y + margin + th), min(w, x + margin + tw)
+            res = cv2.matchTemplate(
+                roi[top:bottom, left:right], template, cv2.TM_CCOEFF_NORMED)
+            scores[index] = float(res.max())
+
+        return scores
+
+    def match(self, roi, top_k=1):
+        """
+        Returns the top_k (confidence, name) pairs, best first.
+        """
+        scores = self.scores(roi)
+        ranked = np.argsort(scores)[::-1][:top_k]
+        return [(float(scores[i]), self.names[i]) for i in ranked]
+
+
+class PyramidBank:
+    """
+    Coarse-to-fine TemplateBank: every template is scored against a downscaled
+    copy of the ROI, then only the best candidates are scored again at full
+    resolution, around their coarse peak. The returned confidences are the full
+    resolution ones, so they compare to the same thresholds as an exact match.
+    """
+
+    def __init__(self, path, roi_size, gray=False, levels=2, candidates=2):
+        self.fine = TemplateBank(path, roi_size, gray)
+        self.coarse = TemplateBank(path, roi_size, gray, levels)
+        self.names = self.fine.names
+        self.roi_size = self.fine.roi_size
+        self.factor = 2 ** levels
+        self.candidates = candidates
+        self.margin = self.factor + 1
+
+    def __len__(self):
+        return len(self.names)
+
+    def match(self, roi, top_k=1):
+        scores, positions = self.coarse.locate(pyramid_down(roi, self.coarse.levels))
+
+        candidates = [
+            (index, tuple(positions[index] * self.factor))
+            for index in np.argsort(scores)[::-1][:max(top_k, self.candidates)]
+        ]
+        refined = self.fine.refine(roi, candidates, self.margin)
+
+        ranked = sorted(
+            ((confidence, self.names[index]) for (index, confidence) in refined.items()),
+            reverse=True)
+        return ranked[:top_k]
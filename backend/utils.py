@@ -7,7 +7,15 @@ def parse_args():
     parser.add_argument("--templates", type=str, default="./templates", help="Directory where read-only templates are located")
     parser.add_argument("--migrations", type=str, default="./migrations", help="Directory where migration files are located")
     parser.add_argument("--TESSERACT_PATH", type=str, default="./third-party/tesseract-win64/tesseract.exe", help="Path to tesseract executable")
+    parser.add_argument("--ocr", type=str, default="auto", choices=["auto", "tesserocr", "libtesseract", "pytesseract"], help="OCR in-process through tesserocr when it's installed or the bundled libtesseract, or by running the tesseract executable for every read")
+    parser.add_argument("--word-recognition", type=str, default="glyphs", choices=["glyphs", "ocr"], help="Answer OCR checks from word images OCR already decided on, or run OCR for every check")
     parser.add_argument("--port", type=int, default=5000, help="Port to run backend server on")
+    parser.add_argument("--server", type=str, default="threading", choices=["threading", "asyncio"], help="Serve each connection from its own thread, or every connection from one event loop")
+    parser.add_argument("--template-matching", type=str, default="pyramid", choices=["pyramid", "exact"], help="Score templates coarse-to-fine, or every template at full resolution")
+    parser.add_argument("--capture", type=str, default="regions", choices=["regions", "window"], help="Capture only the regions used for detection, or the whole game window")
+    parser.add_argument("--detection", type=str, default="phases", choices=["phases", "all"], help="Only run the detectors that can end the current game phase, or every detector on every frame")
+    parser.add_argument("--debug-frames", type=int, default=0, help="Keep this many recent frames in memory and save them to user data on detection events")
+    parser.add_argument("--rebuild-stats", action="store_true", help="Recompute the dungeon run counters from every recorded run, then exit")
     parser.add_argument("--parent-pid", type=int, default=None, help="PID of parent process to monitor")
     args, _ = parser.parse_known_args()
     return args
@@ -68,6 +68,33 @@ const DataContext = createContext<DataContextType>({
   inventory: [],
 });
 
+function mergeDungeonsEntries(
+  current: DungeonsEntriesResponse,
+  entry: DungeonsEntriesResponse[number],
+): DungeonsEntriesResponse {
+  const isSame = (e: DungeonsEntriesResponse[number]) =>
+    e.dungeonId === entry.dungeonId && e.characterId === entry.characterId;
+
+  // The list holds every tracked character in every dungeon, so a missing
+  // pair is a run of an untracked character, which the list never shows
+  if (!current.some(isSame)) {
+    return current;
+  }
+  return current.map((e) => (isSame(e) ? entry : e));
+}
+
+function mergeInventory(
+  current: InventoryItem[],
+  stacks: InventoryItem[],
+): InventoryItem[] {
+  const updated = new Map(stacks.map((stack) => [stack.stackId, stack]));
+  const merged = current.map((item) => updated.get(item.stackId) ?? item);
+  const added = stacks.filter(
+    (stack) => !current.some((item) => item.stackId === stack.stackId),
+  );
+  return [...merged, ...added].sort((a, b) => a.itemId - b.itemId);
+}
+
 export function useDataContext() {
   const ctx = useContext(DataContext);
   if (!ctx) {
@@ -208,7 +235,8 @@ export function DataContextProvider({
       });
 
       evtSource.addEventListener("dungeons", (e: MessageEvent) => {
-        const { type, dungeon_id } = JSON.parse(e.data.replaceAll("'", '"'));
+        const { type, dungeon_id, entries, inventory, statistics } =
+          JSON.parse(e.data);
         switch (type) {
           case "started_dungeon":
             queryClient.invalidateQueries({ queryKey: ["recommendation"] });
@@ -221,12 +249,43 @@ export function DataContextProvider({
 
           case "completed_dungeon":
             setPlayingDungeonId(null);
-            queryClient.invalidateQueries({ queryKey: ["dungeons_entries"] });
-            queryClient.invalidateQueries({ queryKey: ["statistics"] });
-            queryClient.invalidateQueries({ queryKey: ["inventory"] });
+            // The event carries everything the run changed
+            if (entries) {
+              queryClient.setQueryData<DungeonsEntriesResponse>(
+                ["dungeons_entries"],
+                (current) => current && mergeDungeonsEntries(current, entries),
+              );
+            } else {
+              queryClient.invalidateQueries({ queryKey: ["dungeons_entries"] });
+            }
+
+            if (statistics) {
+              queryClient.setQueryData<StatisticsData>(
+                ["statistics"],
+                statistics,
+              );
+            } else {
+              queryClient.invalidateQueries({ queryKey: ["statistics"] });
+            }
+
+            if (inventory) {
+              queryClient.setQueryData<InventoryItem[]>(
+                ["inventory"],
+                (current) => current && mergeInventory(current, inventory),
+              );
+            } else {
+              queryClient.invalidateQueries({ queryKey: ["inventory"] });
+            }
             break;
         }
       });
+
+      // Sent on reconnect when the events missed in between weren't kept
+      evtSource.addEventListener("resync", () => {
+        queryClient.invalidateQueries();
+      });
+
+      return () => evtSource.close();
     }
   }, [port, characters]);
 